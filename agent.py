@@ -1,6 +1,6 @@
 from dataclasses import dataclass, field
 import time, importlib, inspect, os, json, asyncio
-from typing import Any, Optional, Dict
+from typing import Any, Callable, Optional, Dict
 from python.helpers import extract_tools, rate_limiter, files, errors
 from python.helpers.print_style import PrintStyle
 from langchain.schema import AIMessage
@@ -16,6 +16,7 @@ class AgentConfig:
     utility_model: BaseChatModel | BaseLLM
     embeddings_model:Embeddings
     memory_subdir: str = ""
+    knowledge_subdirs: list[str] = field(default_factory=lambda: ["default", "custom"])
     auto_memory_count: int = 3
     auto_memory_skip: int = 2
     rate_limit_seconds: int = 60
@@ -63,6 +64,7 @@ class Agent:
         self.intervention_status = False
         self.rate_limiter = rate_limiter.RateLimiter(max_calls=self.config.rate_limit_requests,max_input_tokens=self.config.rate_limit_input_tokens,max_output_tokens=self.config.rate_limit_output_tokens,window_seconds=self.config.rate_limit_seconds)
         self.data = {} # free data object all the tools can use
+        self.listeners: list[Callable[[dict], Any]] = [] # called with each event of the loop, see emit
 
         os.chdir(files.get_abs_path("./work_dir")) #change CWD to work_dir
         
@@ -97,6 +99,7 @@ class Agent:
                     
                     # output that the agent is starting
                     PrintStyle(bold=True, font_color="green", padding=True, background_color="white").print(f"{self.agent_name}: Starting a message:")
+                    self.emit("response_start")
                                             
                     async for chunk in chain.astream(inputs):
                         if await self.handle_intervention(agent_response): break # wait for intervention and handle it, if paused
@@ -107,9 +110,11 @@ class Agent:
                         
                         if content:
                             printer.stream(content) # output the agent response stream                
+                            self.emit("token", content=content)
                             agent_response += content # concatenate stream into the response
 
                     await self.rate_limiter.set_output_tokens(int(len(agent_response)/4))
+                    self.emit("response", content=agent_response)
                     
                     if not await self.handle_intervention(agent_response):
                         if self.last_message == agent_response: #if assistant_response is the same as last message in history, let him know
@@ -129,10 +134,38 @@ class Agent:
                     msg_response = files.read_file("./prompts/fw.error.md", error=error_message) # error message template
                     self.append_message(msg_response, human=True)
                     PrintStyle(font_color="red", padding=True).print(msg_response)
+                    self.emit("error", message=error_message)
                     
         finally:
             Agent.streaming_agent = None # unset current streamer
 
+    def emit(self, type: str, **data):
+        # events go to the listeners of this agent and of its superiors, so a
+        # listener on the top agent also sees what subordinates do
+        event = {"type": type, "agent": self.number, **data}
+        agent = self
+        while agent:
+            for listener in agent.listeners:
+                try: listener(event)
+                except Exception as e: PrintStyle(font_color="red", padding=True).print(f"Event listener failed: {e}")
+            agent = agent.get_data("superior")
+
+    def reset(self):
+        # back to a fresh conversation, prompts and rate limiter are kept for reuse
+        subordinate = self.get_data("subordinate")
+        if subordinate: subordinate.reset()
+        for value in self.data.values(): # shells kept in tool state hold processes and connections
+            shell = getattr(value, "shell", None)
+            if shell is not None and hasattr(shell, "close"):
+                try: shell.close()
+                except Exception: pass
+        self.history = []
+        self.last_message = ""
+        self.intervention_message = ""
+        self.intervention_status = False
+        self.data = {}
+        self.listeners = []
+
     def get_data(self, field:str):
         return self.data.get(field, None)
 
@@ -247,7 +280,9 @@ class Agent:
                 if await self.handle_intervention(): return # wait if paused and handle intervention message if needed
                 await tool.before_execution(**tool_args)
                 if await self.handle_intervention(): return # wait if paused and handle intervention message if needed
+                self.emit("tool", name=tool_name, args=tool_args)
                 response = await tool.execute(**tool_args)
+                self.emit("tool_result", name=tool_name, message=response.message, break_loop=response.break_loop)
                 if await self.handle_intervention(): return # wait if paused and handle intervention message if needed
                 await tool.after_execution(response)
                 if await self.handle_intervention(): return # wait if paused and handle intervention message if needed
@@ -256,6 +291,7 @@ class Agent:
                 error_msg = f"Error processing tool '{tool_name}': {str(e)}"
                 self.append_message(error_msg, human=True)
                 PrintStyle(font_color="red", padding=True).print(error_msg)
+                self.emit("error", message=error_msg)
         else:
             msg = files.read_file("prompts/fw.msg_misformat.md")
             self.append_message(msg, human=True)
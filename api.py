@@ -1,16 +1,23 @@
+from dotenv import load_dotenv
+
+# before the helpers, they read their settings from the environment on import
+load_dotenv()
+
 from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from agent import Agent, AgentConfig
 from models import get_openai_chat, get_openai_embedding
 import os
-from dotenv import load_dotenv
+import re
 import logging
 import asyncio
+import json
 import uuid
-from python.tools import memory_tool, knowledge_tool, online_knowledge_tool
+from typing import Literal
+from python.tools import knowledge_tool, memory_tool, online_knowledge_tool
 from python.helpers import files
-
-load_dotenv()
+from python.helpers.memory import Memory
 
 # Set the working directory
 os.chdir(files.get_abs_path("./work_dir"))
@@ -39,10 +46,36 @@ config = AgentConfig(
 
 agents = {}
 
+class AgentPool:
+    # agents built ahead and reset after each run, a request skips reading the
+    # prompts and building the rate limiter, the limiter's window carries over
+    def __init__(self, config: AgentConfig, size: int):
+        self.config = config
+        self.size = size
+        self.idle: list[Agent] = []
+
+    def warm(self):
+        while len(self.idle) < self.size:
+            self.idle.append(Agent(number=0, config=self.config))
+
+    def acquire(self) -> Agent:
+        # more concurrent runs than the pool size get a new agent
+        return self.idle.pop() if self.idle else Agent(number=0, config=self.config)
+
+    def release(self, agent: Agent):
+        agent.reset()
+        if len(self.idle) < self.size:
+            self.idle.append(agent)
+
+agent_pool = AgentPool(config, size=int(os.getenv("API_AGENT_POOL_SIZE") or 4))
+
 class AgentRequest(BaseModel):
     prompt: str
     timeout: int | None = None
 
+class AgentStreamRequest(AgentRequest):
+    format: Literal["ndjson", "sse"] = "ndjson"
+
 class MemoryRequest(BaseModel):
     prompt: str
 
@@ -50,9 +83,15 @@ class RecallRequest(BaseModel):
     prompt: str
     count: int = 5
     threshold: float = 0.1
+    mode: str = Memory.SearchMode.AUTO.value
 
 class ForgetRequest(BaseModel):
     prompt: str
+    threshold: float = 0.75
+
+class SnapshotRequest(BaseModel):
+    name: str  # file in memory/snapshots
+    verify: bool = True
 
 class ResearchRequest(BaseModel):
     prompt: str
@@ -73,8 +112,7 @@ def log_agent_response(agent_id: str, prompt: str, response: str, is_final: bool
 @app.post("/run_agent_async")
 async def run_agent_async(request: AgentRequest, background_tasks: BackgroundTasks):
     agent_id = str(uuid.uuid4())
-    agent = Agent(number=len(agents), config=config)
-    agents[agent_id] = agent
+    agents[agent_id] = agent_pool.acquire()
     
     timeout = request.timeout or 900  # 15 minutes default for async runs
 
@@ -98,12 +136,12 @@ async def run_agent_task(agent_id: str, prompt: str, timeout: int):
         await asyncio.to_thread(log_agent_response, agent_id, prompt, response, is_final=True)
         
     finally:
-        del agents[agent_id]
+        agent_pool.release(agents.pop(agent_id))
 
 @app.post("/run_agent")
 async def run_agent(request: AgentRequest):
     agent_id = str(uuid.uuid4())
-    agent = Agent(number=len(agents), config=config)
+    agent = agent_pool.acquire()
     agents[agent_id] = agent
     
     timeout = request.timeout or 180  # 3 minutes default for non-async runs
@@ -122,15 +160,102 @@ async def run_agent(request: AgentRequest):
         
         return {"result": response}
     finally:
-        del agents[agent_id]
+        agent_pool.release(agents.pop(agent_id))
+
+STREAM_KEEPALIVE_SECONDS = 15
+
+# events of the agent loop as they happen: response_start, token, response, tool,
+# tool_result and error from the agents (subordinates included), then one result
+@app.post("/run_agent/stream")
+async def run_agent_stream(request: AgentStreamRequest):
+    agent_id = str(uuid.uuid4())
+    agent = agent_pool.acquire()
+    agents[agent_id] = agent
+    
+    timeout = request.timeout or 900  # the client sees progress, runs can be long
+
+    events: asyncio.Queue = asyncio.Queue()
+    agent.listeners.append(events.put_nowait)
+
+    async def run():
+        await asyncio.to_thread(log_agent_response, agent_id, request.prompt, "Agent started", is_final=False)
+        agent.append_message(request.prompt, human=True)
+        try:
+            response = await asyncio.wait_for(agent.message_loop(request.prompt), timeout=timeout)
+        except asyncio.TimeoutError:
+            response = f"Agent task timed out after {timeout} seconds."
+        except Exception as e:
+            response = f"Agent task failed: {str(e)}"
+        await asyncio.to_thread(log_agent_response, agent_id, request.prompt, response, is_final=True)
+        events.put_nowait({"type": "result", "agent_id": agent_id, "message": response})
+
+    def finished(_):
+        agent_pool.release(agents.pop(agent_id))
+        events.put_nowait(None)
+
+    task = asyncio.create_task(run())
+    task.add_done_callback(finished)
+
+    def encode(event: dict) -> str:
+        data = json.dumps(event, ensure_ascii=False, default=str)
+        if request.format == "sse":
+            return f"event: {event['type']}\ndata: {data}\n\n"
+        return data + "\n"
+
+    async def stream():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(), STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:  # long tool runs, keeps proxies from closing the connection
+                    yield ": keepalive\n\n" if request.format == "sse" else encode({"type": "keepalive"})
+                    continue
+                if event is None:
+                    break
+                yield encode(event)
+        finally:
+            task.cancel()  # client gone, stop the agent
+
+    media_type = "text/event-stream" if request.format == "sse" else "application/x-ndjson"
+    return StreamingResponse(stream(), media_type=media_type, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.on_event("startup")
+async def preload_knowledge(retry: bool = False):
+    # import knowledge in background, requests are served from what is indexed
+    Memory.start_preload(
+        config.memory_subdir or "default",
+        config.embeddings_model,
+        config.knowledge_subdirs,
+        retry=retry,
+    )
+
+@app.on_event("startup")
+async def warm_agents():
+    agent_pool.warm()
+
+@app.get("/knowledge_status")
+async def knowledge_status(wait: bool = False, timeout: float | None = None, retry: bool = False):
+    if retry and Memory.failed():
+        await preload_knowledge(retry=True)
+    if wait:
+        for subdir in list(Memory.preloading):
+            await Memory.wait_preload(subdir, timeout)
+    return {"knowledge": Memory.status(), "ready": Memory.ready()}
+
+async def get_memory():
+    # the same faiss index and Memory registry the agents use
+    return await Memory.get_by_subdir(
+        memory_subdir=config.memory_subdir or "default",
+        embeddings_model=config.embeddings_model,
+        knowledge_subdirs=config.knowledge_subdirs,
+    )
 
 @app.post("/remember")
 async def remember(request: MemoryRequest):
     try:
-        agent = next(iter(agents.values())) if agents else Agent(number=0, config=config)
-        tool = memory_tool.Memory(agent=agent, name="memory", args={}, message="")
-        result = await tool.execute(memorize=request.prompt)
-        return {"result": result.message}
+        db = await get_memory()
+        id = await db.insert_text(request.prompt)
+        return {"result": files.read_file("./prompts/default/fw.memory_saved.md", memory_id=id)}
     except Exception as e:
         logging.error(f"Error in remember endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -138,10 +263,9 @@ async def remember(request: MemoryRequest):
 @app.post("/forget")
 async def forget(request: ForgetRequest):
     try:
-        agent = next(iter(agents.values())) if agents else Agent(number=0, config=config)
-        tool = memory_tool.Memory(agent=agent, name="memory", args={}, message="")
-        result = await tool.execute(forget=request.prompt)
-        return {"result": result.message}
+        db = await get_memory()
+        deleted = await db.delete_documents_by_query(request.prompt, threshold=request.threshold)
+        return {"result": files.read_file("./prompts/default/fw.memories_deleted.md", memory_count=len(deleted))}
     except Exception as e:
         logging.error(f"Error in forget endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -149,28 +273,59 @@ async def forget(request: ForgetRequest):
 @app.post("/recall")
 async def recall(request: RecallRequest):
     try:
-        agent = next(iter(agents.values())) if agents else Agent(number=0, config=config)
-        tool = memory_tool.Memory(agent=agent, name="memory", args={}, message="")
-        result = await tool.execute(query=request.prompt, count=request.count, threshold=request.threshold)
-        memories = result.message
+        memories = await memory_tool.recall(config, request.prompt, request.count, request.threshold, request.mode)
         return {"result": memories}
     except Exception as e:
         logging.error(f"Error in recall endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# memory snapshots, one portable file a new node serves from without re-embedding
+def snapshot_path(name: str) -> str:
+    if not re.fullmatch(r"[\w.-]{1,100}", name) or name.startswith("."):
+        raise HTTPException(status_code=400, detail="Invalid snapshot name.")
+    os.makedirs(files.get_abs_path("memory", "snapshots"), exist_ok=True)
+    return files.get_abs_path("memory", "snapshots", name)
+
+@app.post("/memory_snapshot/export")
+async def export_memory_snapshot(request: SnapshotRequest):
+    path = snapshot_path(request.name)
+    try:
+        db = await get_memory()
+        footer = await db.export_snapshot(path)
+        return {"result": path, "snapshot": footer}
+    except Exception as e:
+        logging.error(f"Error in memory snapshot export: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/memory_snapshot/import")
+async def import_memory_snapshot(request: SnapshotRequest):
+    path = snapshot_path(request.name)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Snapshot not found.")
+    try:
+        db = await Memory.import_snapshot(
+            path,
+            memory_subdir=config.memory_subdir or "default",
+            embeddings_model=config.embeddings_model,
+            knowledge_subdirs=config.knowledge_subdirs,
+            verify=request.verify,
+        )
+        return {"result": path, "count": db.db.index.ntotal}
+    except Exception as e:
+        logging.error(f"Error in memory snapshot import: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# research endpoints search directly, no agent is involved
 @app.post("/research")
 async def research(request: ResearchRequest):
-    agent = next(iter(agents.values())) if agents else Agent(number=0, config=config)
-    tool = knowledge_tool.Knowledge(agent=agent, name="knowledge", args={"prompt": request.prompt}, message="")
-    response = await tool.execute(prompt=request.prompt)
-    return {"result": response.message}
+    try:
+        return {"result": await knowledge_tool.search(config, request.prompt)}
+    except Exception as e:
+        return {"result": f"An error occurred during knowledge search: {str(e)}"}
 
 @app.post("/perplexity_search")
 async def perplexity_search(request: ResearchRequest):
-    agent = next(iter(agents.values())) if agents else Agent(number=0, config=config)
-    tool = online_knowledge_tool.OnlineKnowledge(agent=agent, name="online_knowledge", args={"prompt": request.prompt}, message="")
-    response = await tool.execute()
-    return {"result": response.message}
+    return {"result": await online_knowledge_tool.process_prompt(request.prompt)}
 
 if __name__ == "__main__":
     import uvicorn
@@ -56,26 +56,22 @@ class MemorizeSolutions(Extension):
         # save chat history
         db = await Memory.get(self.agent)
 
-        solutions_txt = ""
-        rem = []
-        for solution in solutions:
-            # solution to plain text:
-            txt = f"# Problem\n {solution['problem']}\n# Solution\n {solution['solution']}"
-            solutions_txt += txt + "\n\n"
-
-            # remove previous solutions too similiar to this one
-            if self.REPLACE_THRESHOLD > 0:
-                rem += await db.delete_documents_by_query(
-                    query=txt,
-                    threshold=self.REPLACE_THRESHOLD,
-                    filter=f"area=='{Memory.Area.SOLUTIONS.value}'",
-                )
-                if rem:
-                    rem_txt = "\n\n".join(Memory.format_docs_plain(rem))
-                    log_item.update(replaced=rem_txt)
-
-            # insert new solution
-            db.insert_text(text=txt, metadata={"area": Memory.Area.SOLUTIONS.value})
+        # solutions to plain text:
+        txts = [
+            f"# Problem\n {solution['problem']}\n# Solution\n {solution['solution']}"
+            for solution in solutions
+        ]
+        solutions_txt = "\n\n".join(txts) + "\n\n"
+
+        # insert new solutions and remove previous ones too similiar to them
+        _, rem = await db.upsert_batch(
+            texts=txts,
+            area=Memory.Area.SOLUTIONS.value,
+            replace_threshold=self.REPLACE_THRESHOLD,
+        )
+        if rem:
+            rem_txt = "\n\n".join(Memory.format_docs_plain(rem))
+            log_item.update(replaced=rem_txt)
 
         solutions_txt = solutions_txt.strip()
         log_item.update(solutions=solutions_txt)
@@ -0,0 +1,102 @@
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Callable, Iterable
+
+# identifiers like file names, error codes, uuids and paths are kept whole and also split into parts
+TOKEN_PATTERN = re.compile(r"[0-9a-z_]+(?:[.\-:/][0-9a-z_]+)*")
+PART_SEPARATORS = re.compile(r"[.\-:/]")
+
+
+def tokenize(text: str) -> list[str]:
+    tokens = []
+    for match in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(match)
+        parts = PART_SEPARATORS.split(match)
+        if len(parts) > 1:
+            tokens += [part for part in parts if part]
+    return tokens
+
+
+def whole_tokens(text: str) -> list[str]:
+    # identifiers as written, without the parts tokenize adds
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def is_identifier(query: str) -> bool:
+    # single token containing digits or punctuation - file name, error code, uuid...
+    query = query.strip()
+    return bool(
+        query
+        and not any(c.isspace() for c in query)
+        and re.search(r"[\d._\-/:]", query)
+    )
+
+
+class BM25Index:
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: dict[str, dict[str, int]] = {}  # term -> {id: term frequency}
+        self.terms: dict[str, list[str]] = {}  # id -> distinct terms, for removal
+        self.lengths: dict[str, int] = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def add(self, id: str, text: str):
+        if id in self.lengths:
+            self.remove([id])
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[id] = tf
+        self.terms[id] = list(counts)
+        self.lengths[id] = sum(counts.values())
+        self.total_length += self.lengths[id]
+
+    def add_many(self, items: Iterable[tuple[str, str]]):
+        for id, text in items:
+            self.add(id, text)
+
+    def has_terms(self, id: str, terms: Iterable[str]) -> bool:
+        return all(id in self.postings.get(term, {}) for term in terms)
+
+    def remove(self, ids: Iterable[str]):
+        for id in ids:
+            if id not in self.lengths:
+                continue
+            for term in self.terms.pop(id):
+                posting = self.postings[term]
+                del posting[id]
+                if not posting:
+                    del self.postings[term]
+            self.total_length -= self.lengths.pop(id)
+
+    def search(
+        self,
+        query: str,
+        limit: int,
+        accept: Callable[[str], bool] | None = None,
+    ) -> list[tuple[str, float]]:
+        if not self.lengths:
+            return []
+
+        count = len(self.lengths)
+        avg_length = self.total_length / count or 1
+        scores: dict[str, float] = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for id, tf in posting.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[id] / avg_length)
+                scores[id] = scores.get(id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        hits = scores.items()
+        if accept:
+            hits = [hit for hit in hits if accept(hit[0])]
+        return heapq.nlargest(limit, hits, key=lambda hit: hit[1])
@@ -1,34 +1,162 @@
 import asyncio
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import os
 import threading
+import time
+import zlib
 from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Any, Callable, Optional, Coroutine
 
+# agent contexts are spread over a pool of loop threads, a context busy with cpu work
+# only delays the contexts on its own loop
+LOOP_THREADS = max(1, int(os.environ.get("AGENT_LOOP_THREADS") or 1))
+LOOP_ASSIGN = os.environ.get("AGENT_LOOP_ASSIGN") or "hash"  # hash or least_load
+LAG_INTERVAL = 0.5  # seconds between lag samples
+LAG_SAMPLES = 120  # max lag over the last minute
+
+# key of the context the tasks started in this scope belong to, see pinned
+pinned_key: ContextVar[Optional[str]] = ContextVar("pinned_key", default=None)
+
+
+@contextmanager
+def pinned(key: str):
+    # deferred tasks created inside run on the loop the key is pinned to
+    token = pinned_key.set(key)
+    try:
+        yield
+    finally:
+        pinned_key.reset(token)
+
+
 class EventLoopThread:
-    _instance = None
+    _instances: dict[int, "EventLoopThread"] = {}
+    _pinned: dict[str, int] = {}  # key -> loop index
     _lock = threading.Lock()
 
-    def __new__(cls):
+    def __new__(cls, index: int = 0):
+        with cls._lock:
+            instance = cls._instances.get(index)
+            if instance is None:
+                instance = super(EventLoopThread, cls).__new__(cls)
+                instance._setup(index, asyncio.new_event_loop())
+                instance.thread = threading.Thread(target=instance._run_event_loop, daemon=True, name=f"event-loop-{index}") # type: ignore
+                instance.thread.start() # type: ignore
+                instance._start_monitor()
+                cls._instances[index] = instance
+            return instance
+
+    @classmethod
+    def attach(cls, loop: asyncio.AbstractEventLoop):
+        # run deferred tasks on an already running loop (asgi server) instead of an own thread
+        # the loop becomes the first of the pool, the others still get threads
+        # must be called before the first task, result_sync must not be used on that loop
+        with cls._lock:
+            if 0 in cls._instances:
+                raise RuntimeError("Event loop thread already started")
+            instance = super(EventLoopThread, cls).__new__(cls)
+            instance._setup(0, loop)
+            instance.thread = None # type: ignore
+            instance._start_monitor()
+            cls._instances[0] = instance
+            return instance
+
+    @classmethod
+    def for_key(cls, key: str) -> "EventLoopThread":
+        # the loop a context runs on, the same one for its whole lifetime
+        with cls._lock:
+            index = cls._pinned.get(key)
+            if index is None:
+                if LOOP_ASSIGN == "least_load":
+                    counts = Counter(cls._pinned.values())
+                    index = min(range(LOOP_THREADS), key=lambda i: (counts[i], cls._load(i)))
+                else:
+                    index = zlib.crc32(key.encode()) % LOOP_THREADS
+                cls._pinned[key] = index
+        return cls(index)
+
+    @classmethod
+    def release(cls, key: str):
+        # context removed, it no longer counts towards the load of its loop
         with cls._lock:
-            if cls._instance is None:
-                cls._instance = super(EventLoopThread, cls).__new__(cls)
-                cls._instance.loop = asyncio.new_event_loop() # type: ignore
-                cls._instance.thread = threading.Thread(target=cls._instance._run_event_loop, daemon=True) # type: ignore
-                cls._instance.thread.start() # type: ignore
-            return cls._instance
+            cls._pinned.pop(key, None)
+
+    @classmethod
+    def current(cls) -> Optional["EventLoopThread"]:
+        # the pool loop the caller runs on, tasks started by a task stay on its loop
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+        for instance in list(cls._instances.values()):
+            if instance.loop is loop:
+                return instance
+        return None
+
+    @classmethod
+    def metrics(cls) -> list[dict]:
+        counts = Counter(cls._pinned.values())
+        return [
+            {
+                "loop": index,
+                "thread": instance.thread.name if instance.thread else "attached",
+                "contexts": counts[index],
+                "tasks": instance.tasks,
+                "lag_ms": round(instance.lag * 1000, 1),
+                "max_lag_ms": round(max(instance.lags, default=0.0) * 1000, 1),
+            }
+            for index, instance in sorted(cls._instances.items())
+        ]
+
+    @classmethod
+    def _load(cls, index: int) -> int:
+        instance = cls._instances.get(index)
+        return instance.tasks if instance else 0
+
+    def _setup(self, index: int, loop: asyncio.AbstractEventLoop):
+        self.index = index
+        self.loop = loop
+        self.tasks = 0  # coroutines submitted and not finished
+        self.tasks_lock = threading.Lock()
+        self.lag = 0.0  # last sample, seconds
+        self.lags: deque[float] = deque(maxlen=LAG_SAMPLES)
+
+    def _start_monitor(self):
+        asyncio.run_coroutine_threadsafe(self._monitor(), self.loop)
+
+    async def _monitor(self):
+        # how late a timer fires is how long ready callbacks wait on this loop
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(LAG_INTERVAL)
+            self.lag = max(0.0, time.monotonic() - start - LAG_INTERVAL)
+            self.lags.append(self.lag)
 
     def _run_event_loop(self):
         asyncio.set_event_loop(self.loop) # type: ignore
         self.loop.run_forever() # type: ignore
 
+    def _task_done(self, _):
+        with self.tasks_lock:
+            self.tasks -= 1
+
     def run_coroutine(self, coro):
-        return asyncio.run_coroutine_threadsafe(coro, self.loop) # type: ignore
+        with self.tasks_lock:
+            self.tasks += 1
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop) # type: ignore
+        future.add_done_callback(self._task_done)
+        return future
 
 class DeferredTask:
     def __init__(self, func: Callable[..., Coroutine[Any, Any, Any]], *args: Any, **kwargs: Any):
         self.func = func
         self.args = args
         self.kwargs = kwargs
-        self.event_loop_thread = EventLoopThread()
+        key = pinned_key.get()
+        self.event_loop_thread = (
+            EventLoopThread.for_key(key) if key else EventLoopThread.current() or EventLoopThread()
+        )
         self._future: Optional[Future] = None
         self._start_task()
 
@@ -52,16 +180,14 @@ class DeferredTask:
     async def result(self, timeout: Optional[float] = None) -> Any:
         if not self._future:
             raise RuntimeError("Task hasn't been started")
-        
-        loop = asyncio.get_running_loop()
-        
-        def _get_result():
-            try:
-                return self._future.result(timeout) # type: ignore
-            except TimeoutError:
-                raise TimeoutError("The task did not complete within the specified timeout.")
-        
-        return await loop.run_in_executor(None, _get_result)
+
+        # completion callback bridged to the caller's loop, waiting holds no thread
+        # shielded, a timeout or a cancelled waiter does not cancel the task itself
+        future = asyncio.wrap_future(self._future)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError("The task did not complete within the specified timeout.")
 
     def kill(self) -> None:
         if self._future and not self._future.done():
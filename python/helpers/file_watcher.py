@@ -0,0 +1,232 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Callable
+
+# inotify through libc on linux, stat polling everywhere else
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+)
+EVENT = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+
+def _load_inotify():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6")
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_uint32,
+        ]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class FileWatcher:
+    # calls callback(paths) with changed files once no change came for debounce seconds
+    def __init__(
+        self,
+        roots: list[str],
+        callback: Callable[[set[str]], None],
+        debounce: float = 2.0,
+        poll_interval: float = 5.0,
+        force_polling: bool = False,
+    ):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.callback = callback
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.force_polling = force_polling
+        self.pending: set[str] = set()
+        self.last_event = 0.0
+        self.stopped = threading.Event()
+        self.thread: threading.Thread | None = None
+        self.mode = ""
+        self.libc = None
+        self.fd = -1
+        self.watches: dict[int, str] = {}  # inotify watch descriptor -> directory
+        # roots that do not exist yet and the parents watched for their creation
+        self.missing: set[str] = set()
+        self.parents: dict[int, str] = {}
+
+    def start(self):
+        if self.thread:
+            return
+        libc = None if self.force_polling else _load_inotify()
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC) if libc else -1
+        if fd >= 0:
+            self.mode = "inotify"
+            self.libc, self.fd = libc, fd
+            for root in self.roots:  # before start returns, no change is missed
+                if os.path.isdir(root):
+                    self._add_tree(root)
+                else:
+                    self.missing.add(root)
+            self._arm_missing()
+            target, args = self._run_inotify, ()
+        else:
+            self.mode = "polling"
+            target, args = self._run_polling, (self._scan_roots(),)
+        self.thread = threading.Thread(
+            target=target, args=args, daemon=True, name="file-watcher"
+        )
+        self.thread.start()
+
+    def stop(self):
+        # the thread exits within a second, pending changes are dropped
+        self.stopped.set()
+        self.thread = None
+
+    def _changed(self, path: str):
+        self.pending.add(path)
+        self.last_event = time.monotonic()
+
+    def _flush(self):
+        # debounce, editors write a file in several steps
+        if not self.pending or time.monotonic() - self.last_event < self.debounce:
+            return
+        paths, self.pending = self.pending, set()
+        try:
+            self.callback(paths)
+        except Exception as e:
+            print(f"File watcher callback failed: {e}")
+
+    def _add_tree(self, root: str, report: bool = False):
+        for dir, _, names in os.walk(root):
+            wd = self.libc.inotify_add_watch(  # type: ignore
+                self.fd, os.fsencode(dir), WATCH_MASK
+            )
+            if wd >= 0:
+                self.watches[wd] = dir
+            if report:  # files created together with a new directory
+                for name in names:
+                    self._changed(os.path.join(dir, name))
+
+    def _arm_missing(self):
+        # a missing root is watched through its nearest existing parent, once it
+        # is created it is watched and the files already in it are reported
+        for root in list(self.missing):
+            while True:
+                if os.path.isdir(root):
+                    self.missing.discard(root)
+                    self._add_tree(root, report=True)
+                    break
+                parent = os.path.dirname(root)
+                while parent != os.path.dirname(parent) and not os.path.isdir(parent):
+                    parent = os.path.dirname(parent)
+                if parent in self.parents.values():
+                    break
+                wd = self.libc.inotify_add_watch(  # type: ignore
+                    self.fd, os.fsencode(parent), WATCH_MASK
+                )
+                if wd < 0:
+                    break
+                if wd not in self.watches:
+                    self.parents[wd] = parent
+                # checked again, the root may have been created meanwhile
+
+    def _run_inotify(self):
+        fd, watches = self.fd, self.watches
+        try:
+            while not self.stopped.is_set():
+                timeout = self.debounce / 2 if self.pending else 1.0
+                readable, _, _ = select.select([fd], [], [], timeout)
+                if readable:
+                    try:
+                        data = os.read(fd, 64 * 1024)
+                    except BlockingIOError:
+                        data = b""
+                    offset = 0
+                    while offset + EVENT.size <= len(data):
+                        wd, mask, _, length = EVENT.unpack_from(data, offset)
+                        offset += EVENT.size
+                        name = data[offset : offset + length].rstrip(b"\0")
+                        offset += length
+
+                        if mask & IN_Q_OVERFLOW:
+                            # events lost, report everything under the roots
+                            for path in self._scan_roots():
+                                self._changed(path)
+                            continue
+                        if mask & IN_IGNORED:
+                            removed = watches.pop(wd, None)
+                            parent = self.parents.pop(wd, None)
+                            if removed in self.roots:
+                                self.missing.add(removed)  # may come back
+                            if parent or removed in self.roots:
+                                self._arm_missing()
+                            continue
+                        if wd in self.parents:
+                            # only the creation of missing roots matters here
+                            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                                self._arm_missing()
+                            continue
+                        dir = watches.get(wd)
+                        if dir is None or not name:
+                            continue
+                        path = os.path.join(dir, os.fsdecode(name))
+                        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                            self._add_tree(path, report=True)
+                        else:
+                            # a removed directory stands for every file below it
+                            self._changed(path)
+                self._flush()
+        finally:
+            os.close(fd)
+
+    def _run_polling(self, snapshot: dict[str, tuple[int, int]]):
+        while not self.stopped.wait(self.poll_interval):
+            current = self._scan_roots()
+            for path in snapshot.keys() | current.keys():
+                if snapshot.get(path) != current.get(path):
+                    self._changed(path)
+            snapshot = current
+            self._flush()
+
+    def _scan_roots(self) -> dict[str, tuple[int, int]]:
+        return {path: stat for root in self.roots for path, stat in _scan(root).items()}
+
+
+def _scan(root: str) -> dict[str, tuple[int, int]]:
+    # path -> (size, mtime ns) of every file under root
+    result = {}
+    for dir, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            result[path] = (stat.st_size, stat.st_mtime_ns)
+    return result
@@ -0,0 +1,177 @@
+import json
+import os
+import re
+import time
+from langchain_core.messages import AIMessage, HumanMessage
+from agent import Agent, AgentContext
+from initialize import initialize
+from python.helpers import defer, files
+from python.helpers.log import Log, spill_path
+
+# contexts idle for a while are written to disk and dropped from memory,
+# the next request for them loads them back, callers serialize the calls
+
+HIBERNATE_SECONDS = int(os.environ.get("CONTEXT_HIBERNATE_SECONDS") or 1800)  # 0 = never
+CHECK_INTERVAL = 60  # seconds between idle checks
+LOG_TAIL = 50  # log items kept in the snapshot, older ones stay in the spill file
+
+last_used: dict[str, float] = {}  # context id -> last request for it
+hibernated: dict[str, dict] = {}  # context id -> summary, for the contexts list
+
+
+def touch(ctxid: str):
+    last_used[ctxid] = time.monotonic()
+
+
+def scan():
+    # contexts hibernated before a restart, only the summary lines are read
+    dir = files.get_abs_path("tmp", "contexts")
+    if not os.path.isdir(dir):
+        return
+    for name in os.listdir(dir):
+        if not name.endswith(".jsonl"):
+            continue
+        try:
+            with open(os.path.join(dir, name), encoding="utf-8") as f:
+                summary = json.loads(f.readline())
+        except (OSError, ValueError):
+            continue
+        hibernated[summary["id"]] = summary
+
+
+def hibernate_idle() -> int:
+    # number of contexts hibernated
+    if not HIBERNATE_SECONDS:
+        return 0
+    now = time.monotonic()
+    count = 0
+    for context in list(AgentContext._contexts.values()):
+        if now - last_used.setdefault(context.id, now) >= HIBERNATE_SECONDS:
+            count += hibernate(context)
+    return count
+
+
+def hibernate(context: AgentContext) -> bool:
+    if not _valid_id(context.id):
+        return False
+    if context.process and context.process.is_alive():  # busy, not idle
+        return False
+
+    agents = []
+    agent = context.agent0
+    while agent:
+        agents.append(agent)
+        agent = agent.get_data("subordinate")
+
+    summary = {
+        "id": context.id,
+        "no": context.no,
+        "log_guid": context.log.guid,
+        "paused": context.paused,
+        "hibernated": True,
+    }
+    snapshot = {
+        "agents": [_dump_agent(agent) for agent in agents],
+        "log": context.log.dump(LOG_TAIL),
+    }
+
+    # summary line first, scan reads only that
+    path = _path(context.id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(json.dumps(summary) + "\n")
+        f.write(json.dumps(snapshot, ensure_ascii=False) + "\n")
+    os.replace(path + ".tmp", path)
+
+    AgentContext.remove(context.id)
+    context.agent0.reset()  # closes shells down the agent chain
+    defer.EventLoopThread.release(context.id)
+    last_used.pop(context.id, None)
+    hibernated[context.id] = summary
+    return True
+
+
+def resume(ctxid: str) -> AgentContext | None:
+    # None if the context was not hibernated
+    if ctxid not in hibernated or not _valid_id(ctxid):
+        return None
+    path = _path(ctxid)
+    with open(path, encoding="utf-8") as f:
+        summary = json.loads(f.readline())
+        snapshot = json.loads(f.readline())
+
+    context = AgentContext(config=initialize(), id=ctxid)
+    context.no = summary["no"]
+    context.paused = summary["paused"]
+    context.log = Log.load(snapshot["log"])
+
+    superior = None
+    for data in snapshot["agents"]:
+        if superior is None:
+            agent = context.agent0
+        else:
+            agent = Agent(data["number"], context.config, context)
+            agent.set_data("superior", superior)
+            superior.set_data("subordinate", agent)
+        _load_agent(agent, data)
+        superior = agent
+
+    os.remove(path)
+    del hibernated[ctxid]
+    touch(ctxid)
+    return context
+
+
+def discard(ctxid: str):
+    # removed while hibernated, the snapshot and the log spill file go too
+    summary = hibernated.pop(ctxid, None)
+    if not summary:
+        return
+    for path in (_path(ctxid), spill_path(summary["log_guid"])):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _dump_agent(agent: Agent) -> dict:
+    # history and the json serializable part of the agent data, the rest is
+    # runtime state (shells, agent links) the tools create again when needed
+    data = {}
+    for key, value in agent.data.items():
+        if key in ("superior", "subordinate"):
+            continue
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            continue
+        data[key] = value
+    return {
+        "number": agent.number,
+        "history": [
+            {"type": message.type, "content": message.content}
+            for message in agent.history
+        ],
+        "last_message": agent.last_message,
+        "data": data,
+    }
+
+
+def _load_agent(agent: Agent, data: dict):
+    agent.history = [
+        (
+            HumanMessage(content=message["content"])
+            if message["type"] == "human"
+            else AIMessage(content=message["content"])
+        )
+        for message in data["history"]
+    ]
+    agent.last_message = data["last_message"]
+    agent.data.update(data["data"])
+
+
+def _valid_id(ctxid: str) -> bool:
+    # ids come from clients and become file names
+    return bool(re.fullmatch(r"[\w-]{1,100}", ctxid))
+
+
+def _path(ctxid: str) -> str:
+    return files.get_abs_path("tmp", "contexts", f"{ctxid}.jsonl")
@@ -1,8 +1,14 @@
+import asyncio
+import codecs
 import glob
+import multiprocessing
 import os
 import hashlib
 import json
-from typing import Any, Dict, Literal, TypedDict
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any, AsyncIterator, Dict, Iterator, Literal, TypedDict
 from langchain_community.document_loaders import (
     CSVLoader,
     JSONLoader,
@@ -11,28 +17,286 @@ from langchain_community.document_loaders import (
     UnstructuredHTMLLoader,
     UnstructuredMarkdownLoader,
 )
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 from python.helpers import files
 from python.helpers.log import LogItem
 
 text_loader_kwargs = {"autodetect_encoding": True}
 
+# processes used to parse and split changed knowledge files, 0 = one per cpu
+IMPORT_WORKERS = int(os.environ.get("KNOWLEDGE_IMPORT_WORKERS") or 0)
+
+# files above this size are streamed, chunks are embedded and inserted per batch
+# only types read piecewise, text in blocks, pdf by page and csv by row, html and
+# json loaders read the whole file and are parsed in a worker at any size
+STREAM_THRESHOLD = 16 * 1024 * 1024
+STREAMED_TYPES = ["txt", "md", "pdf", "csv"]
+TEXT_BLOCK_SIZE = 1024 * 1024
+BATCH_SIZE = 64
+MAX_IN_FLIGHT_BATCHES = 2
+
+# Mapping file extensions to corresponding loader classes
+file_types_loaders = {
+    "txt": TextLoader,
+    "pdf": PyPDFLoader,
+    "csv": CSVLoader,
+    "html": UnstructuredHTMLLoader,
+    "json": JSONLoader,
+    # "md": UnstructuredMarkdownLoader,
+    "md": TextLoader,
+}
+
 
 class KnowledgeImport(TypedDict):
     file: str
     checksum: str
+    size: int
+    mtime: int  # nanoseconds
     ids: list[str]
+    hashes: list[str]  # content hash per chunk, same order as ids
     state: Literal["changed", "original", "removed"]
+    metadata: dict[str, Any]
     documents: list[Any]
 
 
-def calculate_checksum(file_path: str) -> str:
-    hasher = hashlib.md5()
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+
+
+def calculate_checksum(file_path: str, legacy: bool = False) -> str:
+    # blake2b is faster than md5 on 64-bit cpus, md5 only to verify old index entries
+    hasher = hashlib.md5() if legacy else hashlib.blake2b(digest_size=16)
     with open(file_path, "rb") as f:
-        buf = f.read()
-        hasher.update(buf)
+        for chunk in iter(lambda: f.read(CHECKSUM_CHUNK_SIZE), b""):
+            hasher.update(chunk)
     return hasher.hexdigest()
 
 
+def content_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def is_file_changed(file_path: str, file_data: dict[str, Any]) -> bool:
+    # updates checksum, size and mtime in file_data, hashes only if size or mtime differ
+    stat = os.stat(file_path)
+    if (
+        file_data.get("size") == stat.st_size
+        and file_data.get("mtime") == stat.st_mtime_ns
+    ):
+        return False
+
+    checksum = calculate_checksum(file_path)
+    if "size" not in file_data and "checksum" in file_data:
+        # entry from an index without size and mtime, stored checksum is md5
+        changed = file_data["checksum"] != calculate_checksum(file_path, legacy=True)
+    else:
+        changed = file_data.get("checksum") != checksum
+
+    file_data["checksum"] = checksum
+    file_data["size"] = stat.st_size
+    file_data["mtime"] = stat.st_mtime_ns
+    return changed
+
+
+def iter_file_batches(
+    file_path: str, metadata: dict[str, Any], batch_size: int = 0
+) -> Iterator[list[Any]]:
+    # lazy load and split, never more than one batch of chunks in memory
+    batch_size = batch_size or BATCH_SIZE
+    ext = file_path.split(".")[-1].lower()
+    splitter = RecursiveCharacterTextSplitter()  # same as load_and_split default
+    if ext in ["txt", "md"] and _is_utf8(file_path):
+        docs = (
+            Document(text, metadata={"source": file_path})
+            for text in iter_text_chunks(file_path, splitter)
+        )
+    else:  # loaders that autodetect the encoding read the whole file
+        loader_cls = file_types_loaders[ext]
+        loader = loader_cls(
+            file_path,
+            **(text_loader_kwargs if ext in ["txt", "csv", "html", "md"] else {}),
+        )
+        docs = (
+            doc
+            for document in loader.lazy_load()
+            for doc in splitter.split_documents([document])
+        )
+
+    batch = []
+    for doc in docs:
+        doc.metadata = {**doc.metadata, **metadata}
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_text_chunks(
+    file_path: str, splitter: RecursiveCharacterTextSplitter
+) -> Iterator[str]:
+    # utf-8 text split block by block, each block is split up to its last break
+    # and the raw text after it goes on with the next block, words stay whole
+    # the next block is read ahead, the last one is split whole
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    with open(file_path, "rb") as f:
+        block = f.read(TEXT_BLOCK_SIZE)
+        while True:
+            following = f.read(TEXT_BLOCK_SIZE)
+            text = pending + decoder.decode(block, final=not following)
+            if not following:
+                yield from splitter.split_text(text)
+                return
+            cut = _last_break(text, len(pending))
+            pending = text[cut:]
+            yield from splitter.split_text(text[:cut])
+            block = following
+
+
+def _last_break(text: str, start: int) -> int:
+    # paragraph, line or word break after start the text can be split at, the end
+    # if none, searching after start keeps the carried text within a block
+    for separator in ("\n\n", "\n", " "):
+        position = text.rfind(separator, start)
+        if position > 0:
+            return position
+    return len(text)
+
+
+def _is_utf8(file_path: str) -> bool:
+    # first block only, other encodings go through the autodetecting loader
+    with open(file_path, "rb") as f:
+        block = f.read(TEXT_BLOCK_SIZE)
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(block, final=False)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def load_file(file_path: str, metadata: dict[str, Any]) -> list[list[Any]]:
+    # runs in a worker process, must stay importable without the agent
+    return list(iter_file_batches(file_path, metadata))
+
+
+async def stream_file(
+    file_path: str, metadata: dict[str, Any]
+) -> AsyncIterator[list[Any]]:
+    # parse in a thread, bounded queue keeps at most MAX_IN_FLIGHT_BATCHES waiting
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_IN_FLIGHT_BATCHES)
+    stopped = threading.Event()
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce():
+        try:
+            for batch in iter_file_batches(file_path, metadata):
+                if stopped.is_set():
+                    return
+                put(batch)
+            put(None)
+        except Exception as e:
+            if not stopped.is_set():
+                put(e)
+
+    producer = loop.run_in_executor(None, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # unblock the producer if the consumer stopped early
+        stopped.set()
+        while not queue.empty():
+            queue.get_nowait()
+        await producer
+
+
+async def _iter_batches(batches: list[list[Any]]) -> AsyncIterator[list[Any]]:
+    for batch in batches:
+        yield batch
+
+
+async def _failed(error: Exception) -> AsyncIterator[list[Any]]:
+    # a file that could not be parsed, raised to the consumer of its batches
+    raise error
+    yield
+
+
+async def parse_files(
+    items: list[tuple[str, dict[str, Any]]], workers: int = 0
+) -> AsyncIterator[tuple[str, AsyncIterator[list[Any]]]]:
+    # yields (file, batches of documents), batches must be consumed before the next file
+    # a file that fails to parse yields batches raising its error, the others go on
+    if not items:
+        return
+    loop = asyncio.get_running_loop()
+
+    # large files are streamed in bounded batches instead of parsed whole in a worker
+    large = [
+        item
+        for item in items
+        if item[0].split(".")[-1].lower() in STREAMED_TYPES
+        and os.path.getsize(item[0]) > STREAM_THRESHOLD
+    ]
+    small = [item for item in items if item not in large]
+    for file_path, metadata in large:
+        yield file_path, stream_file(file_path, metadata)
+
+    workers = min(workers or IMPORT_WORKERS or os.cpu_count() or 1, len(small))
+    if workers <= 1:
+        for file_path, metadata in small:
+            try:
+                batches = await loop.run_in_executor(None, load_file, file_path, metadata)
+            except Exception as e:
+                yield file_path, _failed(e)
+                continue
+            yield file_path, _iter_batches(batches)
+        return
+
+    # spawn, forking a process with running loop and executor threads is unsafe
+    pool = ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+    async def run(file_path: str, metadata: dict[str, Any]):
+        try:
+            batches = await loop.run_in_executor(pool, load_file, file_path, metadata)
+        except Exception as e:
+            return file_path, _failed(e)
+        return file_path, _iter_batches(batches)
+
+    # sliding window in completion order, parsed results never pile up
+    def submit(count: int):
+        return {asyncio.ensure_future(run(*item)) for item in islice(queued, count)}
+
+    queued = iter(small)
+    pending = submit(workers * 2)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                yield task.result()
+                pending |= submit(1)
+    finally:
+        # consumer stopped early, queued files are dropped and running workers
+        # are not waited for on the loop
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
 def load_knowledge(
     log_item: LogItem | None,
     knowledge_dir: str,
@@ -43,19 +307,7 @@ def load_knowledge(
 
     # from python.helpers.memory import Memory
 
-    # Mapping file extensions to corresponding loader classes
-    file_types_loaders = {
-        "txt": TextLoader,
-        "pdf": PyPDFLoader,
-        "csv": CSVLoader,
-        "html": UnstructuredHTMLLoader,
-        "json": JSONLoader,
-        # "md": UnstructuredMarkdownLoader,
-        "md": TextLoader,
-    }
-
     cnt_files = 0
-    cnt_docs = 0
 
     # for area in Memory.Area:
     #     subdir = files.get_abs_path(knowledge_dir, area.value)
@@ -80,34 +332,20 @@ def load_knowledge(
     for file_path in kn_files:
         ext = file_path.split(".")[-1].lower()
         if ext in file_types_loaders:
-            checksum = calculate_checksum(file_path)
             file_key = file_path  # os.path.relpath(file_path, knowledge_dir)
 
             # Load existing data from the index or create a new entry
             file_data = index.get(file_key, {})
 
-            if file_data.get("checksum") == checksum:
-                file_data["state"] = "original"
-            else:
+            if is_file_changed(file_path, file_data):
                 file_data["state"] = "changed"
+            else:
+                file_data["state"] = "original"
 
             if file_data["state"] == "changed":
-                file_data["checksum"] = checksum
-                loader_cls = file_types_loaders[ext]
-                loader = loader_cls(
-                    file_path,
-                    **(
-                        text_loader_kwargs
-                        if ext in ["txt", "csv", "html", "md"]
-                        else {}
-                    ),
-                )
-                file_data["documents"] = loader.load_and_split()
-                for doc in file_data["documents"]:
-                    doc.metadata = {**doc.metadata, **metadata}
+                # parsed later by parse_files, in parallel
+                file_data["metadata"] = metadata
                 cnt_files += 1
-                cnt_docs += len(file_data["documents"])
-                # print(f"Imported {len(file_data['documents'])} documents from {file_path}")
 
             # Update the index
             index[file_key] = file_data  # type: ignore
@@ -117,9 +355,7 @@ def load_knowledge(
         if not file_data.get("state", ""):
             index[file_key]["state"] = "removed"
 
-    print(f"Processed {cnt_docs} documents from {cnt_files} files.")
+    print(f"Found {cnt_files} new or changed files.")
     if log_item:
-        log_item.stream(
-            progress=f"\nProcessed {cnt_docs} documents from {cnt_files} files."
-        )
+        log_item.stream(progress=f"\nFound {cnt_files} new or changed files.")
     return index
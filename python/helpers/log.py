@@ -1,8 +1,13 @@
+import asyncio
 from dataclasses import dataclass, field
+from functools import wraps
 import json
-from typing import Literal, Optional, Dict
+import os
+from typing import Any, Literal, Optional, Dict
+import threading
 import uuid
 from collections import OrderedDict  # Import OrderedDict
+from python.helpers import files
 
 
 Type = Literal[
@@ -19,6 +24,71 @@ Type = Literal[
     "warning",
 ]
 
+# compact, no circular reference check, no escaping of non ascii text
+encoder = json.JSONEncoder(
+    ensure_ascii=False, check_circular=False, separators=(",", ":")
+)
+
+# length marks kept per streamed field, see LogItem.lengths
+MAX_LENGTH_MARKS = 64
+
+# push channels wait on this instead of polling, counts changes of all logs
+changes = threading.Condition()
+changes_count = 0
+async_waiters: set[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = set()
+
+
+def notify_changes():
+    global changes_count
+    with changes:
+        changes_count += 1
+        changes.notify_all()
+        waiters = list(async_waiters)
+        async_waiters.clear()
+    for loop, future in waiters:  # changes come from any thread
+        loop.call_soon_threadsafe(_wake, future)
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _locked(method):
+    # agents stream into a log from their loop threads while clients read it
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def wait_for_changes(seen: int, timeout: float) -> int:
+    # returns the new count, the same count on timeout
+    with changes:
+        changes.wait_for(lambda: changes_count != seen, timeout)
+        return changes_count
+
+
+async def await_changes(seen: int, timeout: float) -> int:
+    # wait_for_changes for event loops, does not block a thread
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    with changes:
+        if changes_count != seen:
+            return changes_count
+        waiter = (loop, future)
+        async_waiters.add(waiter)
+    try:
+        await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        with changes:
+            async_waiters.discard(waiter)
+    return changes_count
+
 
 @dataclass
 class LogItem:
@@ -30,10 +100,26 @@ class LogItem:
     temp: bool
     kvps: Optional[OrderedDict] = None  # Use OrderedDict for kvps
     guid: str = ""
+    version: int = 0  # log version of the last change of this item
+    # chunks streamed since the last materialize, by field and by kvps key
+    # the first chunk is the text before streaming, fields are joined lazily
+    streams: dict[str, list[str]] = field(default_factory=dict, repr=False)
+    kvps_streams: dict[str, list[str]] = field(default_factory=dict, repr=False)
+    # (version, length, utf-16 length) of text fields after each append since they
+    # were last set, kvps keys as "kvps.<key>", lets output send only what was appended
+    lengths: dict[str, list[tuple[int, int, int]]] = field(
+        default_factory=dict, repr=False
+    )
+    # serialized full output and the version it was made at
+    json_cache: tuple[int, str] = field(default=(-1, ""), repr=False)
 
     def __post_init__(self):
         self.guid = self.log.guid
 
+    @property
+    def lock(self) -> threading.RLock:
+        return self.log.lock
+
     def update(
         self,
         type: Type | None = None,
@@ -55,35 +141,131 @@ class LogItem:
             )
 
     def stream(self, heading: str | None = None, content: str | None = None, **kwargs):
-        if heading is not None:
-            self.update(heading=self.heading + heading)
-        if content is not None:
-            self.update(content=self.content + content)
+        if self.guid == self.log.guid:
+            self.log.stream_item(self.no, heading=heading, content=content, **kwargs)
 
-        for k, v in kwargs.items():
-            prev = self.kvps.get(k, "") if self.kvps else ""
-            self.update(**{k: prev + v})
+    @_locked
+    def materialize(self):
+        # join streamed chunks, the result stays cached until the next append
+        for name, chunks in self.streams.items():
+            setattr(self, name, "".join(chunks))
+        self.streams.clear()
+        if self.kvps_streams:
+            if self.kvps is None:
+                self.kvps = OrderedDict()
+            for k, chunks in self.kvps_streams.items():
+                self.kvps[k] = "".join(chunks)
+            self.kvps_streams.clear()
 
-    def output(self):
-        return {
+    @_locked
+    def output(self, since: int = 0):
+        # with since, text fields only appended to after that version carry just
+        # the appended text, "deltas" has the offset each of them continues at,
+        # in utf-16 code units like javascript string lengths
+        self.materialize()
+        out = {
             "no": self.no,
             "type": self.type,
             "heading": self.heading,
             "content": self.content,
             "temp": self.temp,
             "kvps": self.kvps,
+            "version": self.version,
         }
+        if not since:
+            return out
+
+        deltas = {}
+        for name in ("heading", "content"):
+            offset = self._offset(name, since)
+            if offset is not None:
+                out[name] = out[name][offset[0] :]
+                deltas[name] = offset[1]
+        if self.kvps:
+            kvps = OrderedDict()
+            for k, v in self.kvps.items():
+                offset = self._offset(f"kvps.{k}", since)
+                if offset is not None:
+                    kvps[k] = v[offset[0] :]
+                    deltas.setdefault("kvps", {})[k] = offset[1]
+                else:
+                    kvps[k] = v
+            out["kvps"] = kvps
+        if deltas:
+            out["deltas"] = deltas
+        return out
+
+    @_locked
+    def output_json(self, since: int = 0) -> str:
+        out = self.output(since)
+        if "deltas" in out:
+            return encoder.encode(out)
+        if self.json_cache[0] != self.version:  # full output, same until next change
+            self.json_cache = (self.version, encoder.encode(out))
+        return self.json_cache[1]
+
+    def _mark(self, key: str, value: Any, appended: bool = False):
+        # value is the new text, or only the appended chunk when appended
+        # called with the new version already set on the item
+        if not isinstance(value, str):
+            self.lengths.pop(key, None)  # not text, always sent whole
+            return
+        marks = self.lengths.get(key, []) if appended else []
+        if appended and not marks:
+            return  # unknown base length, the field is sent whole
+        length, units = len(value), _utf16_length(value)
+        if appended:
+            length, units = marks[-1][1] + length, marks[-1][2] + units
+        marks.append((self.version, length, units))
+        if len(marks) > MAX_LENGTH_MARKS:
+            # keep the first mark, dropping later ones only makes some deltas longer
+            del marks[1 : len(marks) - MAX_LENGTH_MARKS + 1]
+        self.lengths[key] = marks
+
+    def _offset(self, key: str, since: int) -> tuple[int, int] | None:
+        # length and utf-16 length of the field at version since, None if it was
+        # set after that
+        marks = self.lengths.get(key)
+        if not marks or marks[0][0] > since:
+            return None
+        offset = marks[0][1:]
+        for version, length, units in marks:
+            if version > since:
+                break
+            offset = (length, units)
+        return offset
+
+
+def _utf16_length(text: str) -> int:
+    # characters outside the basic multilingual plane are two code units
+    return len(text.encode("utf-16-le")) // 2
+
+
+def spill_path(guid: str) -> str:
+    return files.get_abs_path("tmp", "log_spill", f"{guid}.jsonl")
 
 
 class Log:
 
+    # items kept in memory, older ones are spilled to an append-only jsonl file
+    MEMORY_ITEMS = int(os.environ.get("LOG_MEMORY_ITEMS") or 500)
+    SPILL_BATCH = 100  # items written at once, amortizes the file writes
+
     def __init__(self):
+        self.lock = threading.RLock()
         self.guid: str = str(uuid.uuid4())
-        self.updates: list[int] = []
-        self.logs: list[LogItem] = []
+        self.version = 0
+        # item no -> version of its last change, least recently changed first
+        # one entry per item however often it changes, streaming does not grow it
+        self.updates: OrderedDict[int, int] = OrderedDict()
+        self.logs: list[LogItem | None] = []  # None for spilled items
+        self.first = 0  # items below are spilled, unless restored by a change
+        self.spilled: dict[int, int] = {}  # item no -> offset in the spill file
+        self.restored: set[int] = set()
         self.progress = ""
         self.progress_no = 0
 
+    @_locked
     def log(
         self,
         type: Type,
@@ -105,12 +287,16 @@ class Log:
             temp=temp or False,
         )
         self.logs.append(item)
-        self.updates += [item.no]
+        marks = [("heading", item.heading), ("content", item.content)]
+        marks += [(f"kvps.{k}", v) for k, v in (kvps or {}).items()]
+        self._changed(item, marks)
+        self._spill()
         if heading and item.no >= self.progress_no:
             self.progress = heading
             self.progress_no = item.no
         return item
 
+    @_locked
     def update_item(
         self,
         no: int,
@@ -121,17 +307,26 @@ class Log:
         temp: bool | None = None,
         **kwargs,
     ):
-        item = self.logs[no]
+        item = self._item(no)
+        marks = []
         if type is not None:
             item.type = type
         if heading is not None:
+            marks.append(("heading", heading))
+            item.streams.pop("heading", None)
             item.heading = heading
             if no >= self.progress_no:
                 self.progress = heading
                 self.progress_no = no
         if content is not None:
+            marks.append(("content", content))
+            item.streams.pop("content", None)
             item.content = content
         if kvps is not None:
+            for key in [key for key in item.lengths if key.startswith("kvps.")]:
+                del item.lengths[key]
+            marks += [(f"kvps.{k}", v) for k, v in kvps.items()]
+            item.kvps_streams.clear()
             item.kvps = OrderedDict(kvps)  # Use OrderedDict to keep the order
 
         if temp is not None:
@@ -141,28 +336,195 @@ class Log:
             if item.kvps is None:
                 item.kvps = OrderedDict()  # Ensure kvps is an OrderedDict
             for k, v in kwargs.items():
+                marks.append((f"kvps.{k}", v))
+                item.kvps_streams.pop(k, None)
                 item.kvps[k] = v
 
-        self.updates += [item.no]
+        self._changed(item, marks)
 
-    def output(self, start=None, end=None):
+    @_locked
+    def stream_item(
+        self,
+        no: int,
+        heading: str | None = None,
+        content: str | None = None,
+        **kwargs,
+    ):
+        # appends chunks without copying the text streamed so far
+        item = self._item(no)
+        marks = []
+        if heading is not None:
+            marks.append(("heading", heading, True))
+            item.streams.setdefault("heading", [item.heading]).append(heading)
+            if no >= self.progress_no:
+                item.materialize()  # headings are short, progress needs the text
+                self.progress = item.heading
+                self.progress_no = no
+        if content is not None:
+            marks.append(("content", content, True))
+            item.streams.setdefault("content", [item.content]).append(content)
+        for k, v in kwargs.items():
+            if k in item.kvps_streams or (item.kvps and k in item.kvps):
+                marks.append((f"kvps.{k}", v, True))
+            else:
+                marks.append((f"kvps.{k}", v))  # new key, same as setting it
+            prev = item.kvps.get(k, "") if item.kvps else ""
+            item.kvps_streams.setdefault(k, [prev]).append(v)
+
+        self._changed(item, marks)
+
+    def _changed(self, item: LogItem, marks: list[tuple] = []):
+        self.version += 1
+        item.version = self.version
+        for mark in marks:
+            item._mark(*mark)
+        self.updates[item.no] = self.version
+        self.updates.move_to_end(item.no)
+        notify_changes()
+
+    @_locked
+    def output(self, start=None, end=None, deltas=False):
+        # items changed after version start (up to end), walks changed items only
+        # with deltas, text appended after start is sent as offset and new text
+        since = (start or 0) if deltas else 0
+        return [item.output(since) for item in self._changed_items(start, end)]
+
+    @_locked
+    def output_json(self, start=None, end=None, deltas=False) -> list[str]:
+        # same as output, serialized per item, unchanged full items from cache
+        since = (start or 0) if deltas else 0
+        return [item.output_json(since) for item in self._changed_items(start, end)]
+
+    def _changed_items(self, start=None, end=None) -> list[LogItem]:
         if start is None:
             start = 0
-        if end is None:
-            end = len(self.updates)
 
-        out = []
-        seen = set()
-        for update in self.updates[start:end]:
-            if update not in seen:
-                out.append(self.logs[update].output())
-                seen.add(update)
+        changed = []
+        for no, version in reversed(self.updates.items()):
+            if version <= start:
+                break
+            if end is None or version <= end:
+                changed.append(no)
+
+        # in item order, the ui appends items it has not seen yet
+        # spilled items are left out, they are paged in through history
+        changed.sort()
+        return [self.logs[no] for no in changed if self.logs[no] is not None]
 
+    @_locked
+    def history(self, before: int | None = None, limit: int = 50) -> list[dict]:
+        # up to limit items numbered below before, from memory or the spill file
+        end = len(self.logs) if before is None else min(before, len(self.logs))
+        out = []
+        f = None
+        try:
+            for no in range(max(0, end - limit), end):
+                item = self.logs[no]
+                if item is not None:
+                    out.append(item.output())
+                    continue
+                if f is None:
+                    f = open(self._spill_path(), "rb")
+                f.seek(self.spilled[no])
+                out.append(json.loads(f.readline()))
+        finally:
+            if f:
+                f.close()
         return out
 
+    def _item(self, no: int) -> LogItem:
+        item = self.logs[no]
+        if item is None:  # changed after spilling, back to memory until next spill
+            with open(self._spill_path(), "rb") as f:
+                f.seek(self.spilled[no])
+                item = self._from_output(json.loads(f.readline()))
+            self.logs[no] = item
+            self.restored.add(no)
+        return item
+
+    def _from_output(self, data: dict) -> LogItem:
+        # item back from its full output, spilled or dumped
+        kvps = data["kvps"]
+        return LogItem(
+            log=self,
+            no=data["no"],
+            type=data["type"],
+            heading=data["heading"],
+            content=data["content"],
+            kvps=OrderedDict(kvps) if kvps is not None else None,
+            temp=data["temp"],
+            version=data["version"],
+        )
+
+    def _spill(self, keep: int | None = None):
+        # keep forces spilling down to that many items in memory
+        if keep is None:
+            if len(self.logs) - self.first <= self.MEMORY_ITEMS + self.SPILL_BATCH:
+                return
+            keep = self.MEMORY_ITEMS
+        end = max(self.first, len(self.logs) - keep)
+        if end == self.first and not self.restored:
+            return
+        path = self._spill_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "ab") as f:
+            for no in sorted(self.restored) + list(range(self.first, end)):
+                item = self.logs[no]
+                if item is None:
+                    continue
+                self.spilled[no] = f.tell()  # a later copy of an item wins
+                f.write(item.output_json().encode("utf-8") + b"\n")
+                self.logs[no] = None
+        self.first = end
+        self.restored.clear()
+
+    @_locked
+    def dump(self, tail: int = 50) -> dict:
+        # snapshot for hibernation, all but the last tail items go to the spill file
+        # the snapshot holds the spill index, so nothing is lost and the guid stays
+        self._spill(keep=tail)
+        return {
+            "guid": self.guid,
+            "version": self.version,
+            "length": len(self.logs),
+            "first": self.first,
+            "spilled": list(self.spilled.items()),
+            "progress": self.progress,
+            "progress_no": self.progress_no,
+            "items": [item.output() for item in self.logs[self.first :] if item],
+        }
+
+    @classmethod
+    def load(cls, data: dict) -> "Log":
+        # clients see the same log, changes continue after the dumped version
+        log = cls()
+        log.guid = data["guid"]
+        log.version = data["version"]
+        log.first = data["first"]
+        log.spilled = {no: offset for no, offset in data["spilled"]}
+        log.progress = data["progress"]
+        log.progress_no = data["progress_no"]
+        log.logs = [None] * data["length"]
+        for out in data["items"]:
+            log.logs[out["no"]] = log._from_output(out)
+        for item in sorted(filter(None, log.logs), key=lambda item: item.version):
+            log.updates[item.no] = item.version
+        return log
+
+    def _spill_path(self) -> str:
+        return spill_path(self.guid)
+
+    @_locked
     def reset(self):
+        if self.spilled and os.path.exists(self._spill_path()):
+            os.remove(self._spill_path())
         self.guid = str(uuid.uuid4())
-        self.updates = []
+        self.version = 0
+        self.updates = OrderedDict()
         self.logs = []
+        self.first = 0
+        self.spilled = {}
+        self.restored = set()
         self.progress = ""
         self.progress_no = 0
+        notify_changes()
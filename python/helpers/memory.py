@@ -1,5 +1,11 @@
-from datetime import datetime
-from typing import Any, List, Sequence
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, asynccontextmanager, contextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+import threading
+import time
+from typing import Any, AsyncIterator, List, Literal, Sequence
 from langchain.storage import InMemoryByteStore, LocalFileStore
 from langchain.embeddings import CacheBackedEmbeddings
 
@@ -16,8 +22,10 @@ import numpy as np
 from . import files
 from langchain_core.documents import Document
 import uuid
-from python.helpers import knowledge_import
+from python.helpers import knowledge_import, bm25, memory_snapshot
 from python.helpers.log import Log, LogItem
+from python.helpers.defer import DeferredTask
+from python.helpers.file_watcher import FileWatcher
 from enum import Enum
 from agent import Agent
 
@@ -32,6 +40,27 @@ class MyFaiss(FAISS):
         return self.get_by_ids(ids)
 
 
+@dataclass
+class RetentionPolicy:
+    max_count: int = 0  # 0 = unlimited, least recently recalled are evicted first
+    max_age_days: float = 0  # 0 = unlimited, based on the timestamp metadata
+
+
+@dataclass
+class PreloadStatus:
+    state: Literal["pending", "running", "ready", "failed"] = "pending"
+    files: int = 0  # new or changed files to import
+    processed: int = 0
+    documents: int = 0
+    error: str = ""
+    attempts: int = 0  # failed imports in a row
+    started: float = 0
+    finished: float = 0
+
+    def output(self):
+        return asdict(self)
+
+
 class Memory:
 
     class Area(Enum):
@@ -40,35 +69,409 @@ class Memory:
         SOLUTIONS = "solutions"
         INSTRUMENTS = "instruments"
 
+    class SearchMode(Enum):
+        AUTO = "auto"  # keyword lookup for identifiers, vector search otherwise
+        VECTOR = "vector"
+        KEYWORD = "keyword"
+        HYBRID = "hybrid"
+
+    # auto-memorized areas only, main area holds user memories and knowledge
+    retention: dict[str, RetentionPolicy] = {
+        Area.FRAGMENTS.value: RetentionPolicy(max_count=5000, max_age_days=365),
+        Area.SOLUTIONS.value: RetentionPolicy(max_count=2000, max_age_days=730),
+    }
+    COMPACTION_INTERVAL = 60 * 60  # seconds
+
+    # loaded subdirs are unloaded when idle, over count or over the memory budget
+    IDLE_UNLOAD_SECONDS = 30 * 60
+    MIN_IDLE_SECONDS = 60  # never unload a subdir used more recently than this
+    MAX_LOADED_SUBDIRS = 16
+    MEMORY_BUDGET_MB = 1024
+
+    # dedicated pool for faiss searches, docstore pickling and index mutations
+    EXECUTOR_WORKERS = int(os.environ.get("MEMORY_EXECUTOR_WORKERS") or 2)
+    OMP_THREADS = int(os.environ.get("MEMORY_OMP_THREADS") or 0)  # 0 = faiss default
+    executor: ThreadPoolExecutor | None = None
+    locks: dict[str, threading.Lock] = {}
+
     index: dict[str, "MyFaiss"] = {}
+    lexical_indexes: dict[str, bm25.BM25Index] = {}
+    recall_hits: dict[str, dict[str, str]] = {}  # memory id -> last recall timestamp
+    last_compaction: dict[str, float] = {}
+    compacting: set[str] = set()
+    compaction_tasks: dict[str, asyncio.Task] = {}
+    last_used: dict[str, float] = {}
+    in_flight: dict[str, int] = {}  # running operations and imports, never unloaded
+    busy_lock = threading.Lock()  # in_flight and unloading, from any loop thread
+    preloaded: set[str] = set()  # knowledge already imported in this process
+    preloading: dict[str, DeferredTask] = {}  # background knowledge imports
+    preload_status: dict[str, PreloadStatus] = {}
+    # preload and watcher imports, these run on any agent loop thread
+    import_locks: dict[str, threading.Lock] = {}
+    PRELOAD_RETRY_SECONDS = 5 * 60  # after a failed import, doubled per failure
+    PRELOAD_MAX_RETRY_SECONDS = 60 * 60
+
+    # re-import changed knowledge and instruments without restart
+    WATCH_KNOWLEDGE = (os.environ.get("KNOWLEDGE_WATCH") or "1") != "0"
+    WATCH_DEBOUNCE_SECONDS = 2.0
+    watchers: dict[str, FileWatcher] = {}
 
     @staticmethod
     async def get(agent: Agent):
-        memory_subdir = agent.config.memory_subdir or "default"
+        return await Memory.get_by_subdir(
+            memory_subdir=agent.config.memory_subdir or "default",
+            embeddings_model=agent.config.embeddings_model,
+            knowledge_subdirs=agent.config.knowledge_subdirs,
+            log=agent.context.log,
+            agent=agent,
+        )
+
+    @staticmethod
+    async def get_by_subdir(
+        memory_subdir: str,
+        embeddings_model,
+        knowledge_subdirs: list[str] = [],
+        log: Log | None = None,
+        agent: Agent | None = None,
+        wait_preload: bool = False,
+    ):
+        # shared by agents and the api, one index per subdir in the process
+        # knowledge is imported in background, searches see what is indexed so far
+        Memory.last_used[memory_subdir] = time.time()
+        Memory.unload_idle()
+        log_item = None
         if Memory.index.get(memory_subdir) is None:
-            log_item = agent.context.log.log(
-                type="util",
-                heading=f"Initializing VectorDB in '/{memory_subdir}'",
+            if log:
+                log_item = log.log(
+                    type="util",
+                    heading=f"Initializing VectorDB in '/{memory_subdir}'",
+                )
+            await Memory.run_locked(
+                memory_subdir, Memory._load, log_item, embeddings_model, memory_subdir
+            )
+        if knowledge_subdirs:
+            Memory.start_preload(
+                memory_subdir, embeddings_model, knowledge_subdirs, log_item
+            )
+            if wait_preload:
+                await Memory.wait_preload(memory_subdir)
+        return Memory(
+            agent=agent,
+            db=Memory.index[memory_subdir],
+            memory_subdir=memory_subdir,
+        )
+
+    @staticmethod
+    def _load(log_item: LogItem | None, embeddings_model, memory_subdir: str):
+        # under the subdir lock, concurrent first calls load the index only once
+        if Memory.index.get(memory_subdir) is not None:
+            return
+        db = Memory.initialize(log_item, embeddings_model, memory_subdir, False)
+        Memory._import_chroma(memory_subdir, db)
+        Memory.lexical_indexes[memory_subdir] = Memory._build_lexical(db)
+        Memory.recall_hits[memory_subdir] = Memory._load_recalls(memory_subdir)
+        Memory.index[memory_subdir] = db
+
+    @staticmethod
+    def _legacy_chroma_dirs(memory_subdir: str) -> list[str]:
+        # the store was at memory/<config.memory_subdir>/database, the unset subdir
+        # is "" there and "default" here
+        dirs = [files.get_abs_path("memory", memory_subdir, "database")]
+        if memory_subdir == "default":
+            dirs.insert(0, files.get_abs_path("memory", "database"))
+        return dirs
+
+    @staticmethod
+    def _import_chroma(memory_subdir: str, db: MyFaiss) -> int:
+        # under the subdir lock, one-time move of the memories the api used to keep
+        # in a separate chroma store, the directory is renamed once imported
+        chroma_dir = next(
+            (dir for dir in Memory._legacy_chroma_dirs(memory_subdir) if os.path.isdir(dir)),
+            None,
+        )
+        if chroma_dir is None:
+            return 0
+        try:
+            import chromadb
+        except ImportError:
+            print(
+                f"Memories in '{chroma_dir}' are in the old chroma store and not used, "
+                "install chromadb to import them once."
+            )
+            return 0
+
+        try:
+            client = chromadb.PersistentClient(path=chroma_dir)
+            collection = client.get_collection("langchain")  # langchain_chroma default
+            data = collection.get(include=["documents", "metadatas", "embeddings"])
+        except Exception as e:
+            print(f"Memories in '{chroma_dir}' could not be imported: {e}")
+            return 0
+
+        texts = data["documents"] or []
+        embeddings = data["embeddings"]
+        if texts:
+            if embeddings is None or len(embeddings[0]) != db.index.d:
+                # another embedding model back then
+                embeddings = db.embedding_function.embed_documents(texts)
+            timestamp = Memory.get_timestamp()
+            metadatas = [
+                {
+                    "area": Memory.Area.MAIN.value,
+                    "timestamp": timestamp,
+                    **(metadata or {}),
+                    "id": id,
+                }
+                for id, metadata in zip(data["ids"], data["metadatas"] or [None] * len(texts))
+            ]
+            db.add_embeddings(
+                text_embeddings=list(zip(texts, [list(e) for e in embeddings])),
+                metadatas=metadatas,
+                ids=data["ids"],
+            )
+            db.save_local(folder_path=Memory._abs_db_dir(memory_subdir))
+        os.replace(chroma_dir, chroma_dir + ".imported")
+        print(f"Imported {len(texts)} memories from '{chroma_dir}'.")
+        return len(texts)
+
+    @staticmethod
+    def start_preload(
+        memory_subdir: str,
+        embeddings_model,
+        knowledge_subdirs: list[str],
+        log_item: LogItem | None = None,
+        retry: bool = False,
+    ) -> DeferredTask | None:
+        # at most one import per subdir and process, runs on the agents' event loop
+        # a failed import stays failed until retry is requested or its backoff passed
+        if memory_subdir in Memory.preloaded or memory_subdir in Memory.preloading:
+            return Memory.preloading.get(memory_subdir)
+        previous = Memory.preload_status.get(memory_subdir)
+        if previous and previous.state == "failed" and not retry:
+            backoff = min(
+                Memory.PRELOAD_RETRY_SECONDS * 2 ** (previous.attempts - 1),
+                Memory.PRELOAD_MAX_RETRY_SECONDS,
             )
-            db = Memory.initialize(
-                log_item,
-                agent.config.embeddings_model,
-                memory_subdir,
-                False,
+            if time.time() - previous.finished < backoff:
+                return None
+        status = PreloadStatus(attempts=previous.attempts if previous else 0)
+        Memory.preload_status[memory_subdir] = status
+
+        async def run():
+            status.state = "running"
+            status.started = time.time()
+            try:
+                if Memory.index.get(memory_subdir) is None:
+                    await Memory.run_locked(
+                        memory_subdir,
+                        Memory._load,
+                        log_item,
+                        embeddings_model,
+                        memory_subdir,
+                    )
+                Memory.start_watcher(memory_subdir, knowledge_subdirs)
+                wrap = Memory(None, Memory.index[memory_subdir], memory_subdir)
+                await wrap.preload_knowledge(log_item, knowledge_subdirs, memory_subdir)
+                Memory.preloaded.add(memory_subdir)
+                status.state = "ready"
+                status.attempts = 0
+            except Exception as e:
+                status.state = "failed"
+                status.error = str(e)
+                status.attempts += 1
+                if log_item:
+                    log_item.stream(progress=f"\nKnowledge import failed: {e}")
+                raise
+            finally:
+                status.finished = time.time()
+                Memory.preloading.pop(memory_subdir, None)
+
+        task = DeferredTask(run)
+        Memory.preloading[memory_subdir] = task
+        return task
+
+    @staticmethod
+    def start_watcher(memory_subdir: str, knowledge_subdirs: list[str]):
+        if not Memory.WATCH_KNOWLEDGE or memory_subdir in Memory.watchers:
+            return
+        roots = [
+            files.get_abs_path("knowledge", kn_dir, area.value)
+            for kn_dir in knowledge_subdirs
+            for area in Memory.Area
+        ] + [files.get_abs_path("instruments")]
+
+        def changed(paths: set[str]):
+            # from the watcher thread, import runs on the agents' event loop
+            DeferredTask(Memory._reimport, memory_subdir, knowledge_subdirs, paths)
+
+        watcher = FileWatcher(
+            [root for root in roots if os.path.isdir(root)],
+            changed,
+            debounce=Memory.WATCH_DEBOUNCE_SECONDS,
+        )
+        watcher.start()
+        Memory.watchers[memory_subdir] = watcher
+
+    @staticmethod
+    async def _reimport(
+        memory_subdir: str, knowledge_subdirs: list[str], paths: set[str]
+    ):
+        db = Memory.index.get(memory_subdir)
+        if db is None:
+            return  # unloaded meanwhile, rescanned when loaded again
+        try:
+            await Memory(None, db, memory_subdir).reimport_knowledge(
+                paths, knowledge_subdirs
             )
-            Memory.index[memory_subdir] = db
-            wrap = Memory(agent, db, memory_subdir=memory_subdir)
-            if agent.config.knowledge_subdirs:
-                await wrap.preload_knowledge(
-                    log_item, agent.config.knowledge_subdirs, memory_subdir
+        except Exception as e:
+            print(f"Knowledge re-import in '/{memory_subdir}' failed: {e}")
+
+    @staticmethod
+    async def wait_preload(memory_subdir: str, timeout: float | None = None) -> bool:
+        # True when knowledge of the subdir is fully imported
+        task = Memory.preloading.get(memory_subdir)
+        if task:
+            try:
+                await task.result(timeout)
+            except Exception:
+                pass  # reported in preload_status
+        return memory_subdir in Memory.preloaded
+
+    @staticmethod
+    def ready() -> bool:
+        # every started knowledge import finished successfully
+        return all(
+            status.state == "ready" for status in Memory.preload_status.values()
+        )
+
+    @staticmethod
+    def failed() -> list[str]:
+        return [
+            subdir
+            for subdir, status in Memory.preload_status.items()
+            if status.state == "failed"
+        ]
+
+    @staticmethod
+    def status() -> dict[str, Any]:
+        # readiness and progress of knowledge imports, for poll and status endpoints
+        return {
+            subdir: {**status.output(), "loaded": subdir in Memory.index}
+            for subdir, status in Memory.preload_status.items()
+        }
+
+    @staticmethod
+    def get_executor() -> ThreadPoolExecutor:
+        if Memory.executor is None:
+            if Memory.OMP_THREADS > 0:
+                faiss.omp_set_num_threads(Memory.OMP_THREADS)
+            Memory.executor = ThreadPoolExecutor(
+                max_workers=Memory.EXECUTOR_WORKERS, thread_name_prefix="memory"
+            )
+        return Memory.executor
+
+    @staticmethod
+    async def run_locked(memory_subdir: str, func, *args, **kwargs):
+        # never on the event loop, one operation per subdir at a time
+        lock = Memory.locks.setdefault(memory_subdir, threading.Lock())
+
+        def locked():
+            with lock:
+                return func(*args, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        with Memory._busy(memory_subdir):
+            return await loop.run_in_executor(Memory.get_executor(), locked)
+
+    async def _run(self, func, *args, **kwargs):
+        with Memory._busy(self.memory_subdir):
+            if Memory.index.get(self.memory_subdir) is None:
+                # unloaded while this wrapper was held, continue on a fresh load
+                embeddings_model = self._db.embedding_function.underlying_embeddings  # type: ignore
+                await Memory.run_locked(
+                    self.memory_subdir, Memory._load, None, embeddings_model, self.memory_subdir
                 )
-            return wrap
-        else:
-            return Memory(
-                agent=agent,
-                db=Memory.index[memory_subdir],
-                memory_subdir=memory_subdir,
+            return await Memory.run_locked(self.memory_subdir, func, *args, **kwargs)
+
+    @staticmethod
+    @asynccontextmanager
+    async def _import_lock(memory_subdir: str):
+        # a thread lock, an asyncio lock is bound to the loop that first used it
+        lock = Memory.import_locks.setdefault(memory_subdir, threading.Lock())
+        acquire = asyncio.ensure_future(asyncio.to_thread(lock.acquire))
+        try:
+            await asyncio.shield(acquire)
+        except asyncio.CancelledError:
+            # the thread takes the lock anyway, handed back as soon as it has it
+            acquire.add_done_callback(
+                lambda done: lock.release()
+                if not done.cancelled() and not done.exception()
+                else None
             )
+            raise
+        try:
+            yield
+        finally:
+            lock.release()
+
+    @staticmethod
+    @contextmanager
+    def _busy(memory_subdir: str):
+        # counts as in use for unload_idle until the block exits
+        with Memory.busy_lock:
+            Memory.in_flight[memory_subdir] = Memory.in_flight.get(memory_subdir, 0) + 1
+        try:
+            yield
+        finally:
+            with Memory.busy_lock:
+                Memory.in_flight[memory_subdir] -= 1
+            Memory.last_used[memory_subdir] = time.time()
+
+    @staticmethod
+    def unload_idle():
+        now = time.time()
+        loaded = sorted(Memory.index, key=lambda sd: Memory.last_used.get(sd, 0))
+        size = sum(Memory._estimated_size(sd) for sd in loaded)
+        budget = Memory.MEMORY_BUDGET_MB * 1024 * 1024
+
+        for subdir in loaded:  # least recently used first
+            idle = now - Memory.last_used.get(subdir, 0)
+            if idle < Memory.MIN_IDLE_SECONDS:
+                break
+            if (
+                idle < Memory.IDLE_UNLOAD_SECONDS
+                and len(Memory.index) <= Memory.MAX_LOADED_SUBDIRS
+                and (not budget or size <= budget)
+            ):
+                break
+            if subdir in Memory.compacting or subdir in Memory.preloading:
+                continue
+            with Memory.busy_lock:  # no operation starts between the check and the unload
+                if Memory.in_flight.get(subdir):
+                    continue
+                size -= Memory._estimated_size(subdir)
+                Memory.unload(subdir)
+
+    @staticmethod
+    def unload(memory_subdir: str):
+        # every change is already saved to disk, only recall hits need persisting
+        if memory_subdir in Memory.recall_hits:
+            with Memory.locks.setdefault(memory_subdir, threading.Lock()):
+                Memory._save_recalls(memory_subdir, Memory.recall_hits[memory_subdir])
+        Memory.index.pop(memory_subdir, None)
+        Memory.lexical_indexes.pop(memory_subdir, None)
+        Memory.recall_hits.pop(memory_subdir, None)
+        # knowledge may change while unloaded, rescan on next load
+        Memory.preloaded.discard(memory_subdir)
+        watcher = Memory.watchers.pop(memory_subdir, None)
+        if watcher:
+            watcher.stop()
+
+    @staticmethod
+    def _estimated_size(memory_subdir: str) -> int:
+        # float32 vectors plus roughly the same again for docstore and bm25 postings
+        index = Memory.index[memory_subdir].index
+        return index.ntotal * index.d * 4 * 2
 
     @staticmethod
     def initialize(
@@ -83,30 +486,12 @@ class Memory:
         if log_item:
             log_item.stream(progress="\nInitializing VectorDB")
 
-        em_dir = files.get_abs_path(
-            "memory/embeddings"
-        )  # just caching, no need to parameterize
         db_dir = Memory._abs_db_dir(memory_subdir)
 
-        # make sure embeddings and database directories exist
+        # make sure database directory exists
         os.makedirs(db_dir, exist_ok=True)
 
-        if in_memory:
-            store = InMemoryByteStore()
-        else:
-            os.makedirs(em_dir, exist_ok=True)
-            store = LocalFileStore(em_dir)
-
-        # here we setup the embeddings model with the chosen cache storage
-        embedder = CacheBackedEmbeddings.from_bytes_store(
-            embeddings_model,
-            store,
-            namespace=getattr(
-                embeddings_model,
-                "model",
-                getattr(embeddings_model, "model_name", "default"),
-            ),
-        )
+        embedder = Memory._get_embedder(embeddings_model, in_memory)
 
         # self.db = Chroma(
         #     embedding_function=self.embedder,
@@ -136,60 +521,402 @@ class Memory:
             )
         return db  # type: ignore
 
+    @staticmethod
+    def _get_embedder(embeddings_model, in_memory=False) -> CacheBackedEmbeddings:
+        em_dir = files.get_abs_path(
+            "memory/embeddings"
+        )  # just caching, no need to parameterize
+
+        if in_memory:
+            store = InMemoryByteStore()
+        else:
+            os.makedirs(em_dir, exist_ok=True)
+            store = LocalFileStore(em_dir)
+
+        # here we setup the embeddings model with the chosen cache storage
+        return CacheBackedEmbeddings.from_bytes_store(
+            embeddings_model,
+            store,
+            namespace=Memory._get_model_name(embeddings_model),
+        )
+
+    @staticmethod
+    def _get_model_name(embeddings_model) -> str:
+        return getattr(
+            embeddings_model,
+            "model",
+            getattr(embeddings_model, "model_name", "default"),
+        )
+
+    async def export_snapshot(self, path: str) -> dict[str, Any]:
+        # single versioned file a new node can serve from without re-embedding
+        index_path = files.get_abs_path(
+            Memory._abs_db_dir(self.memory_subdir), "knowledge_import.json"
+        )
+        knowledge = {}
+        if os.path.exists(index_path):
+            with open(index_path, "r") as f:
+                knowledge = json.load(f)
+
+        def export():
+            ids = [self.db.index_to_docstore_id[i] for i in range(self.db.index.ntotal)]
+            docstore = self.db.docstore._dict  # type: ignore
+            return memory_snapshot.write(
+                path,
+                self.db.index.reconstruct_n(0, self.db.index.ntotal),
+                (
+                    {
+                        "id": id,
+                        "page_content": docstore[id].page_content,
+                        "metadata": docstore[id].metadata,
+                    }
+                    for id in ids
+                ),
+                extra={
+                    "model": Memory._get_model_name(
+                        self.db.embedding_function.underlying_embeddings  # type: ignore
+                    ),
+                    "knowledge_import": knowledge,
+                    "recalls": self.recalls,
+                },
+            )
+
+        return await self._run(export)
+
+    @staticmethod
+    async def import_snapshot(
+        path: str,
+        memory_subdir: str,
+        embeddings_model,
+        knowledge_subdirs: list[str] = [],
+        verify: bool = True,
+        agent: Agent | None = None,
+    ):
+        # replaces the memory subdir with the snapshot contents, knowledge folders
+        # are checked against the imported knowledge index afterwards
+
+        def load():
+            snapshot = memory_snapshot.read(path, verify=verify)
+            model = Memory._get_model_name(embeddings_model)
+            snapshot_model = snapshot.extra.get("model")
+            if snapshot_model != model:
+                raise ValueError(
+                    f"Memory snapshot was embedded with '{snapshot_model}', "
+                    f"current embeddings model is '{model}'."
+                )
+
+            index = faiss.IndexFlatIP(snapshot.footer["dim"])
+            if snapshot.footer["count"]:
+                index.add(snapshot.vectors)
+            docs = {
+                item["id"]: Document(item["page_content"], metadata=item["metadata"])
+                for item in snapshot.iter_documents()
+            }
+            db = MyFaiss(
+                embedding_function=Memory._get_embedder(embeddings_model),
+                index=index,
+                docstore=InMemoryDocstore(docs),
+                index_to_docstore_id=dict(enumerate(docs)),
+                distance_strategy=DistanceStrategy.COSINE,
+                relevance_score_fn=Memory._cosine_normalizer,
+            )
+
+            db_dir = Memory._abs_db_dir(memory_subdir)
+            os.makedirs(db_dir, exist_ok=True)
+            db.save_local(folder_path=db_dir)
+            with open(files.get_abs_path(db_dir, "knowledge_import.json"), "w") as f:
+                json.dump(snapshot.extra.get("knowledge_import", {}), f)
+            Memory._save_recalls(memory_subdir, snapshot.extra.get("recalls", {}))
+            return db, Memory._build_lexical(db), snapshot.extra.get("recalls", {})
+
+        # no knowledge import writes into the index being replaced
+        async with Memory._import_lock(memory_subdir):
+            with Memory._busy(memory_subdir):
+                db, lexical, recalls = await Memory.run_locked(memory_subdir, load)
+                Memory.index[memory_subdir] = db
+                Memory.lexical_indexes[memory_subdir] = lexical
+                Memory.recall_hits[memory_subdir] = recalls
+            Memory.preloaded.discard(memory_subdir)
+            watcher = Memory.watchers.pop(memory_subdir, None)
+            if watcher:
+                watcher.stop()
+        if knowledge_subdirs:
+            Memory.start_preload(
+                memory_subdir, embeddings_model, knowledge_subdirs, retry=True
+            )
+        return Memory(agent=agent, db=db, memory_subdir=memory_subdir)
+
     def __init__(
         self,
-        agent: Agent,
+        agent: Agent | None,
         db: MyFaiss,
         memory_subdir: str,
     ):
         self.agent = agent
-        self.db = db
         self.memory_subdir = memory_subdir
+        self._db = db
+        self._lexical = Memory.lexical_indexes[memory_subdir]
+        self._recalls = Memory.recall_hits[memory_subdir]
+
+    # the registered index, a wrapper kept across an unload follows the reload (see _run)
+    @property
+    def db(self) -> MyFaiss:
+        registered = Memory.index.get(self.memory_subdir)
+        return registered if registered is not None else self._db
+
+    @property
+    def lexical(self) -> bm25.BM25Index:
+        registered = Memory.lexical_indexes.get(self.memory_subdir)
+        return registered if registered is not None else self._lexical
+
+    @property
+    def recalls(self) -> dict[str, str]:
+        registered = Memory.recall_hits.get(self.memory_subdir)
+        return registered if registered is not None else self._recalls
 
     async def preload_knowledge(
         self, log_item: LogItem | None, kn_dirs: list[str], memory_subdir: str
     ):
-        # db abs path
-        db_dir = Memory._abs_db_dir(memory_subdir)
+        async with Memory._import_lock(memory_subdir):
+            # globbing, stat and hashing off the loop
+            index = await asyncio.to_thread(self._load_import_index)
 
-        # Load the index file if it exists
-        index_path = files.get_abs_path(db_dir, "knowledge_import.json")
+            # preload knowledge folders
+            index = await asyncio.to_thread(
+                self._preload_knowledge_folders, log_item, kn_dirs, index
+            )
+
+            with Memory._busy(memory_subdir):  # not unloaded halfway, see unload_idle
+                await self._import_knowledge(log_item, index)
+
+    async def reimport_knowledge(
+        self, paths: set[str], kn_dirs: list[str], log_item: LogItem | None = None
+    ):
+        # only the given files or directories, other index entries stay as they are
+        async with Memory._import_lock(self.memory_subdir):
+            index = await asyncio.to_thread(self._scan_paths, paths, kn_dirs)
+            with Memory._busy(self.memory_subdir):
+                await self._import_knowledge(log_item, index)
+
+    def _scan_paths(
+        self, paths: set[str], kn_dirs: list[str]
+    ) -> dict[str, knowledge_import.KnowledgeImport]:
+        # in a thread, stat and hashing of the changed paths
+        index = self._load_import_index()
+        for file_data in index.values():
+            file_data["state"] = "original"
+
+        def check(file: str):
+            metadata = Memory._knowledge_metadata(file, kn_dirs)
+            if metadata is None:
+                return  # not a knowledge file type or outside of areas
+            file_data = index.get(file, {})
+            if knowledge_import.is_file_changed(file, file_data):
+                file_data["state"] = "changed"
+            else:
+                file_data["state"] = "original"
+            file_data["metadata"] = metadata
+            index[file] = file_data  # type: ignore
+
+        for path in paths:
+            if os.path.isfile(path):
+                check(path)
+            elif os.path.isdir(path):  # e.g. moved in or renamed, files under it
+                for root, _, names in os.walk(path):
+                    for name in names:
+                        check(os.path.join(root, name))
+                for file in index:
+                    if file.startswith(path + os.sep) and not os.path.isfile(file):
+                        index[file]["state"] = "removed"
+            else:  # removed file or directory
+                for file in index:
+                    if file == path or file.startswith(path + os.sep):
+                        index[file]["state"] = "removed"
+        return index
+
+    def _load_import_index(self) -> dict[str, knowledge_import.KnowledgeImport]:
+        db_dir = Memory._abs_db_dir(self.memory_subdir)
 
         # make sure directory exists
         if not os.path.exists(db_dir):
             os.makedirs(db_dir)
 
+        # Load the index file if it exists
+        index_path = files.get_abs_path(db_dir, "knowledge_import.json")
         index: dict[str, knowledge_import.KnowledgeImport] = {}
         if os.path.exists(index_path):
             with open(index_path, "r") as f:
                 index = json.load(f)
+        return index
 
-        # preload knowledge folders
-        index = self._preload_knowledge_folders(log_item, kn_dirs, index)
-
+    async def _import_knowledge(
+        self,
+        log_item: LogItem | None,
+        index: dict[str, knowledge_import.KnowledgeImport],
+    ):
         for file in index:
-            if index[file]["state"] in ["changed", "removed"] and index[file].get(
+            if (
+                index[file]["state"] == "removed"
+                or (index[file]["state"] == "changed" and not index[file].get("hashes"))
+            ) and index[file].get(
                 "ids", []
-            ):  # for knowledge files that have been changed or removed and have IDs
+            ):  # removed files and changed files without chunk hashes have IDs
                 await self.delete_documents_by_ids(
                     index[file]["ids"]
                 )  # remove original version
-            if index[file]["state"] == "changed":
-                index[file]["ids"] = self.insert_documents(
-                    index[file]["documents"]
-                )  # insert new version
+                index[file]["ids"] = []
+        self._save_import_index(index)
 
-        # remove index where state="removed"
-        index = {k: v for k, v in index.items() if v["state"] != "removed"}
+        # parse changed files in worker processes, insert each as soon as it is ready
+        changed = [
+            (file, index[file]["metadata"])
+            for file in index
+            if index[file]["state"] == "changed"
+        ]
+        status = Memory.preload_status.setdefault(self.memory_subdir, PreloadStatus())
+        status.files = len(changed)
+        status.processed = 0
+        cnt_docs = 0
+        cnt_new = 0
+        cnt_failed = 0
+        async with aclosing(knowledge_import.parse_files(changed)) as parsed:
+            async for file, batches in parsed:
+                try:
+                    async with aclosing(batches):
+                        docs, new = await self._reimport_file(
+                            index[file], batches
+                        )  # replace changed chunks only, batch by batch
+                except Exception as e:
+                    # skipped, imported again on the next preload or change
+                    msg = f"Failed to import knowledge file '{file}': {e}"
+                    print(msg)
+                    if log_item:
+                        log_item.stream(progress=f"\n{msg}")
+                    for key in ("checksum", "size", "mtime"):
+                        index[file].pop(key, None)
+                    docs, new = 0, 0
+                    cnt_failed += 1
+                index[file]["state"] = "original"
+                self._save_import_index(index)  # an interruption keeps finished files
+                cnt_docs += docs
+                cnt_new += new
+                status.processed += 1
+                status.documents = cnt_docs
 
-        # strip state and documents from index and save it
-        for file in index:
-            if "documents" in index[file]:
-                del index[file]["documents"]  # type: ignore
-            if "state" in index[file]:
-                del index[file]["state"]  # type: ignore
-        with open(index_path, "w") as f:
-            json.dump(index, f)
+        if changed:
+            msg = (
+                f"Processed {cnt_docs} documents from {len(changed) - cnt_failed} files, "
+                f"{cnt_new} new or changed."
+            )
+            if cnt_failed:
+                msg += f" {cnt_failed} files failed."
+            print(msg)
+            if log_item:
+                log_item.stream(progress=f"\n{msg}")
+
+        self._save_import_index(index)
+
+    def _save_import_index(self, index: dict[str, knowledge_import.KnowledgeImport]):
+        # without state, metadata and documents, removed entries are dropped
+        # files still to import are saved without checksum, so an interrupted
+        # import parses them again
+        saved = {}
+        for file, file_data in index.items():
+            if file_data.get("state") == "removed":
+                continue
+            entry = {
+                key: value
+                for key, value in file_data.items()
+                if key not in ("documents", "metadata", "state")
+            }
+            if file_data.get("state") == "changed":
+                for key in ("checksum", "size", "mtime"):
+                    entry.pop(key, None)
+            saved[file] = entry
+
+        index_path = files.get_abs_path(
+            Memory._abs_db_dir(self.memory_subdir), "knowledge_import.json"
+        )
+        with open(index_path + ".tmp", "w") as f:
+            json.dump(saved, f)
+        os.replace(index_path + ".tmp", index_path)
+
+    async def _reimport_file(
+        self,
+        file_data: knowledge_import.KnowledgeImport,
+        batches: AsyncIterator[list[Document]],
+    ) -> tuple[int, int]:
+        # unchanged chunks keep their id and vector, only new content is embedded
+        # batches are embedded and inserted as they arrive, the file is saved once
+        previous: dict[str, list[str]] = {}
+        for hash, id in zip(file_data.get("hashes", []), file_data.get("ids", [])):
+            previous.setdefault(hash, []).append(id)
+
+        def match(documents: list[Document], hashes: list[str]):
+            docstore = self.db.docstore._dict  # type: ignore
+            ids: list[str | None] = []
+            for doc, hash in zip(documents, hashes):
+                candidates = previous.get(hash, [])
+                while candidates and candidates[0] not in docstore:
+                    candidates.pop(0)  # deleted meanwhile, e.g. by memory_forget
+                if candidates:
+                    id = candidates.pop(0)
+                    existing = docstore[id]  # refresh metadata like page numbers
+                    existing.metadata = {
+                        **doc.metadata,
+                        "id": id,
+                        "timestamp": existing.metadata.get("timestamp", ""),
+                    }
+                    ids.append(id)
+                else:
+                    ids.append(None)
+            return ids
+
+        all_ids: list[str] = []
+        all_hashes: list[str] = []
+        cnt_new = 0
+        inserted: list[str] = []
+        try:
+            async for documents in batches:
+                hashes = [
+                    knowledge_import.content_hash(doc.page_content) for doc in documents
+                ]
+                ids = await self._run(match, documents, hashes)
+                new_docs = [doc for doc, id in zip(documents, ids) if id is None]
+                new_ids = await self.insert_documents(new_docs, persist=False)
+                inserted += new_ids
+                fresh = iter(new_ids)
+                all_ids += [id if id is not None else next(fresh) for id in ids]
+                all_hashes += hashes
+                cnt_new += len(new_docs)
+        except Exception:
+            # no chunks of a half imported file, the previous ones stay
+            if inserted:
+                await self._run(self._delete, inserted)
+            raise
+
+        stale = [id for remaining in previous.values() for id in remaining]
+        if stale:
+            await self._run(self._delete, stale)
+        file_data["ids"] = all_ids
+        file_data["hashes"] = all_hashes
+        await self._asave_db()  # persist inserts, deletions and refreshed metadata
+        return len(all_ids), cnt_new
+
+    @staticmethod
+    def _knowledge_metadata(path: str, kn_dirs: list[str]) -> dict[str, Any] | None:
+        # same areas and patterns as _preload_knowledge_folders
+        ext = path.split(".")[-1].lower()
+        if ext not in knowledge_import.file_types_loaders:
+            return None
+        for kn_dir in kn_dirs:
+            for area in Memory.Area:
+                root = files.get_abs_path("knowledge", kn_dir, area.value)
+                if path.startswith(root + os.sep):
+                    return {"area": area.value}
+        if ext == "md" and path.startswith(files.get_abs_path("instruments") + os.sep):
+            return {"area": Memory.Area.INSTRUMENTS.value}
+        return None
 
     def _preload_knowledge_folders(
         self,
@@ -222,12 +949,81 @@ class Memory:
         self, query: str, limit: int, threshold: float, filter: str = ""
     ):
         comparator = Memory._get_comparator(filter) if filter else None
-        return await self.db.asearch(
-            query,
-            search_type="similarity_score_threshold",
-            k=limit,
-            score_threshold=threshold,
-            filter=comparator,
+        # embedding is network bound and stays on the loop, the search is not
+        embedding = await self.db.embedding_function.aembed_query(query)  # type: ignore
+
+        def search():
+            results = self.db.similarity_search_with_score_by_vector(
+                embedding, k=limit, filter=comparator
+            )
+            docs = [
+                doc
+                for doc, score in results
+                if Memory._cosine_normalizer(score) >= threshold
+            ]
+            self._track_recalls(docs)
+            return docs
+
+        return await self._run(search)
+
+    async def search_keyword(
+        self, query: str, limit: int, filter: str = "", exact: bool = False
+    ):
+        # zero-network lookup in the BM25 index kept alongside faiss
+        # exact only returns documents containing each identifier of the query whole
+        comparator = Memory._get_comparator(filter) if filter else None
+        required = bm25.whole_tokens(query) if exact else []
+
+        def search():
+            docstore = self.db.docstore._dict  # type: ignore
+            lexical = self.lexical
+
+            def accept(id: str):
+                doc = docstore.get(id)
+                return (
+                    doc is not None
+                    and (not comparator or comparator(doc.metadata))
+                    and lexical.has_terms(id, required)
+                )
+
+            hits = self.lexical.search(query, limit, accept)
+            docs = self.db.get_by_ids([id for id, _ in hits])
+            self._track_recalls(docs)
+            return docs
+
+        return await self._run(search)
+
+    async def search_hybrid(
+        self, query: str, limit: int, threshold: float, filter: str = ""
+    ):
+        vector_docs = await self.search_similarity_threshold(
+            query, limit=limit, threshold=threshold, filter=filter
+        )
+        keyword_docs = await self.search_keyword(query, limit=limit, filter=filter)
+        return Memory._fuse_rankings([vector_docs, keyword_docs], limit)
+
+    async def search(
+        self,
+        query: str,
+        limit: int,
+        threshold: float,
+        filter: str = "",
+        mode: str = SearchMode.AUTO.value,
+    ):
+        if mode == Memory.SearchMode.KEYWORD.value:
+            return await self.search_keyword(query, limit=limit, filter=filter)
+        if mode == Memory.SearchMode.HYBRID.value:
+            return await self.search_hybrid(query, limit, threshold, filter)
+        if mode == Memory.SearchMode.AUTO.value and bm25.is_identifier(query):
+            # exact identifier lookups skip the embedding round-trip if they hit
+            # the whole identifier, hits on its parts alone go to vector search
+            docs = await self.search_keyword(
+                query, limit=limit, filter=filter, exact=True
+            )
+            if docs:
+                return docs
+        return await self.search_similarity_threshold(
+            query, limit=limit, threshold=threshold, filter=filter
         )
 
     async def delete_documents_by_query(
@@ -253,7 +1049,7 @@ class Memory:
                 # fnd = self.db.get(where={"id": {"$in": document_ids}})
                 # if fnd["ids"]: self.db.delete(ids=fnd["ids"])
                 # tot += len(fnd["ids"])
-                self.db.delete(ids=document_ids)
+                await self._run(self._delete, document_ids)
                 tot += len(document_ids)
 
             # If fewer than K document IDs, break the loop
@@ -261,50 +1057,266 @@ class Memory:
                 break
 
         if tot:
-            self._save_db()  # persist
+            await self._asave_db()  # persist
         return removed
 
     async def delete_documents_by_ids(self, ids: list[str]):
-        # aget_by_ids is not yet implemented in faiss, need to do a workaround
-        rem_docs = self.db.get_by_ids(ids)  # existing docs to remove (prevents error)
-        if rem_docs:
-            rem_ids = [doc.metadata["id"] for doc in rem_docs]  # ids to remove
-            await self.db.adelete(ids=rem_ids)
+        def delete():
+            # aget_by_ids is not yet implemented in faiss, need to do a workaround
+            # existing docs to remove (prevents error)
+            rem_docs = self.db.get_by_ids(ids)
+            if rem_docs:
+                self._delete([doc.metadata["id"] for doc in rem_docs])  # ids to remove
+            return rem_docs
 
+        rem_docs = await self._run(delete)
         if rem_docs:
-            self._save_db()  # persist
+            await self._asave_db()  # persist
         return rem_docs
 
-    def insert_text(self, text, metadata: dict = {}):
+    async def insert_text(self, text, metadata: dict = {}):
         id = str(uuid.uuid4())
         if not metadata.get("area", ""):
             metadata["area"] = Memory.Area.MAIN.value
 
-        self.db.add_documents(
-            documents=[
-                Document(
-                    text,
-                    metadata={"id": id, "timestamp": self.get_timestamp(), **metadata},
-                )
-            ],
-            ids=[id],
+        # embed on the loop, index work in the executor
+        doc = Document(
+            text,
+            metadata={"id": id, "timestamp": self.get_timestamp(), **metadata},
         )
-        self._save_db()  # persist
+        await self._run(self._add, [doc], await self._embed([text]), [id])
+        await self._asave_db()  # persist
         return id
 
-    def insert_documents(self, docs: list[Document]):
+    async def upsert_batch(
+        self, texts: list[str], area: str, replace_threshold: float = 0.9
+    ) -> tuple[list[str], list[Document]]:
+        if not texts:
+            return [], []
+
+        # embed all texts in one request
+        vectors = np.array(await self._embed(texts), dtype=np.float32)
+
+        keep = list(range(len(texts)))
+        if replace_threshold > 0:
+            # later items replace earlier near-duplicates, as if inserted one by one
+            sims = vectors @ vectors.T
+            keep = [
+                i
+                for i in range(len(texts))
+                if not any(
+                    Memory._cosine_normalizer(sims[i][j]) >= replace_threshold
+                    for j in range(i + 1, len(texts))
+                )
+            ]
+
+        # every item gets an id, replaced duplicates in the batch are reported
+        # as removed like replaced existing memories
+        timestamp = self.get_timestamp()
+        all_docs = [
+            Document(
+                text,
+                metadata={"id": str(uuid.uuid4()), "timestamp": timestamp, "area": area},
+            )
+            for text in texts
+        ]
+        docs = [all_docs[i] for i in keep]
+        ids = [doc.metadata["id"] for doc in docs]
+        kept = set(keep)
+        replaced = [doc for i, doc in enumerate(all_docs) if i not in kept]
+
+        def upsert():
+            removed = []
+            if replace_threshold > 0:
+                removed = self._find_similar_by_vectors(
+                    vectors, replace_threshold, area
+                )
+                if removed:
+                    self._delete([doc.metadata["id"] for doc in removed])
+            self._add(docs, vectors[keep].tolist(), ids)
+            return removed
+
+        removed = await self._run(upsert) + replaced
+        await self._asave_db()  # persist once for the whole batch
+        self.schedule_compaction()
+        return ids, removed
+
+    def _find_similar_by_vectors(
+        self, vectors: np.ndarray, threshold: float, area: str
+    ) -> list[Document]:
+        total = self.db.index.ntotal
+        if not total:
+            return []
+
+        # single batched search, widen k until every row drops below the threshold
+        k = min(100, total)
+        while True:
+            scores, indices = self.db.index.search(vectors, k)
+            if k >= total or all(
+                Memory._cosine_normalizer(row[-1]) < threshold for row in scores
+            ):
+                break
+            k = min(k * 2, total)
+
+        found: dict[str, Document] = {}
+        for row_scores, row_indices in zip(scores, indices):
+            for score, idx in zip(row_scores, row_indices):
+                if idx == -1 or Memory._cosine_normalizer(score) < threshold:
+                    continue
+                doc_id = self.db.index_to_docstore_id[idx]
+                doc = self.db.docstore._dict.get(doc_id)  # type: ignore
+                if doc and doc.metadata.get("area") == area:
+                    found[doc_id] = doc
+        return list(found.values())
+
+    async def insert_documents(self, docs: list[Document], persist: bool = True):
         ids = [str(uuid.uuid4()) for _ in range(len(docs))]
         timestamp = self.get_timestamp()
         if ids:
             for doc, id in zip(docs, ids):
                 doc.metadata["id"] = id  # add ids to documents metadata
                 doc.metadata["timestamp"] = timestamp  # add timestamp
-            self.db.add_documents(documents=docs, ids=ids)
-            self._save_db()  # persist
+            embeddings = await self._embed([doc.page_content for doc in docs])
+            await self._run(self._add, docs, embeddings, ids)
+            if persist:
+                await self._asave_db()
         return ids
 
+    async def _embed(self, texts: list[str]) -> list[list[float]]:
+        # cache-backed embedder, only cache misses go to the model in one request
+        return await self.db.embedding_function.aembed_documents(texts)  # type: ignore
+
+    def _add(self, docs: list[Document], embeddings: list[list[float]], ids: list[str]):
+        # executor only, keeps faiss and bm25 in sync
+        self.db.add_embeddings(
+            text_embeddings=[
+                (doc.page_content, emb) for doc, emb in zip(docs, embeddings)
+            ],
+            metadatas=[doc.metadata for doc in docs],
+            ids=ids,
+        )
+        self.lexical.add_many((id, doc.page_content) for doc, id in zip(docs, ids))
+
+    def _delete(self, ids: list[str]):
+        # executor only, keeps faiss and bm25 in sync
+        self.db.delete(ids=ids)
+        self.lexical.remove(ids)
+
+    def schedule_compaction(self):
+        # enforce retention policies in background, at most once per interval
+        subdir = self.memory_subdir
+        if subdir in Memory.compacting:
+            return
+        elapsed = time.time() - Memory.last_compaction.get(subdir, 0)
+        if elapsed < Memory.COMPACTION_INTERVAL:
+            return
+        Memory.compacting.add(subdir)
+
+        async def run():
+            try:
+                await self._run(self.compact)
+            except Exception as e:
+                print(f"Memory compaction in '/{subdir}' failed: {e}")
+            finally:
+                Memory.compacting.discard(subdir)
+                Memory.compaction_tasks.pop(subdir, None)
+
+        # referenced until done, the loop only keeps weak references to tasks
+        Memory.compaction_tasks[subdir] = asyncio.create_task(run())
+
+    def compact(self) -> list[Document]:
+        # executor only, see schedule_compaction
+        recalls = self.recalls
+        docstore: dict[str, Document] = self.db.docstore._dict  # type: ignore
+
+        by_area: dict[str, list[tuple[str, Document]]] = {}
+        for id, doc in docstore.items():
+            area = doc.metadata.get("area", "")
+            if area in Memory.retention:
+                by_area.setdefault(area, []).append((id, doc))
+
+        evict: list[tuple[str, Document]] = []
+        for area, docs in by_area.items():
+            policy = Memory.retention[area]
+            if policy.max_age_days > 0:
+                cutoff = Memory.get_timestamp(
+                    datetime.now() - timedelta(days=policy.max_age_days)
+                )
+                evict += [d for d in docs if Memory._created(d[1]) < cutoff]
+                docs = [d for d in docs if Memory._created(d[1]) >= cutoff]
+            if policy.max_count > 0 and len(docs) > policy.max_count:
+                # least recently recalled (or created, if never recalled) go first
+                docs.sort(
+                    key=lambda d: max(Memory._created(d[1]), recalls.get(d[0], ""))
+                )
+                evict += docs[: len(docs) - policy.max_count]
+
+        if evict:
+            # one bulk removal rewrites the flat index once instead of per document
+            self._delete([id for id, _ in evict])
+
+        for id in [id for id in recalls if id not in docstore]:
+            del recalls[id]
+
+        Memory.last_compaction[self.memory_subdir] = time.time()
+        if evict:
+            self._save_db()  # persist
+        return [doc for _, doc in evict]
+
+    def _track_recalls(self, docs: list[Document]):
+        # executor only, recalls are read and saved under the same subdir lock
+        timestamp = self.get_timestamp()
+        for doc in docs:
+            self.recalls[doc.metadata["id"]] = timestamp
+
+    async def _asave_db(self):
+        await self._run(self._save_db)
+
     def _save_db(self):
-        self.db.save_local(folder_path=self._abs_db_dir(self.memory_subdir))
+        db_dir = self._abs_db_dir(self.memory_subdir)
+        self.db.save_local(folder_path=db_dir)
+        Memory._save_recalls(self.memory_subdir, self.recalls)
+
+    @staticmethod
+    def _save_recalls(memory_subdir: str, recalls: dict[str, str]):
+        # under the subdir lock, written aside and swapped in, never left truncated
+        path = files.get_abs_path(Memory._abs_db_dir(memory_subdir), "recalls.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(recalls, f)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def _load_recalls(memory_subdir: str) -> dict[str, str]:
+        path = files.get_abs_path(Memory._abs_db_dir(memory_subdir), "recalls.json")
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    return json.load(f)
+            except ValueError as e:
+                # recall hits only order evictions, losing them must not block loading
+                print(f"Ignoring corrupt recalls in '/{memory_subdir}': {e}")
+        return {}
+
+    @staticmethod
+    def _build_lexical(db: MyFaiss) -> bm25.BM25Index:
+        lexical = bm25.BM25Index()
+        lexical.add_many(
+            (id, doc.page_content) for id, doc in db.docstore._dict.items()  # type: ignore
+        )
+        return lexical
+
+    @staticmethod
+    def _fuse_rankings(rankings: list[list[Document]], limit: int, k: int = 60):
+        # reciprocal rank fusion, scores from both indexes are not comparable directly
+        scores: dict[str, float] = {}
+        docs: dict[str, Document] = {}
+        for ranking in rankings:
+            for rank, doc in enumerate(ranking):
+                id = doc.metadata["id"]
+                scores[id] = scores.get(id, 0.0) + 1 / (k + rank + 1)
+                docs[id] = doc
+        ranked = sorted(scores, key=scores.__getitem__, reverse=True)
+        return [docs[id] for id in ranked[:limit]]
 
     @staticmethod
     def _get_comparator(condition: str):
@@ -346,5 +1358,9 @@ class Memory:
         return result
 
     @staticmethod
-    def get_timestamp():
-        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    def _created(doc: Document) -> str:
+        return doc.metadata.get("timestamp", "")
+
+    @staticmethod
+    def get_timestamp(dt: datetime | None = None):
+        return (dt or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import struct
+from dataclasses import dataclass
+from typing import Any, Iterable, Iterator
+
+import numpy as np
+
+# single file layout, no pickle anywhere:
+#   MAGIC | version u32 | padding to ALIGN
+#   vectors   float32[count, dim], aligned so it can be memory mapped
+#   documents json lines {"id", "page_content", "metadata"} in vector order
+#   footer    json with dim, count, section offsets, extras and sha256 of the sections
+#   footer length u64 | MAGIC
+
+MAGIC = b"A0MEMSNP"
+VERSION = 1
+ALIGN = 64
+PREAMBLE = struct.Struct("<8sI")
+TRAILER = struct.Struct("<Q8s")
+
+
+@dataclass
+class Snapshot:
+    path: str
+    footer: dict[str, Any]
+    vectors: np.ndarray  # read-only memory map
+
+    @property
+    def extra(self) -> dict[str, Any]:
+        return self.footer.get("extra", {})
+
+    def iter_documents(self) -> Iterator[dict[str, Any]]:
+        offset, length = self.footer["sections"]["documents"]
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            remaining = length
+            while remaining > 0:
+                line = f.readline(remaining)
+                remaining -= len(line)
+                if line.strip():
+                    yield json.loads(line)
+
+
+def write(
+    path: str,
+    vectors: np.ndarray,
+    documents: Iterable[dict[str, Any]],
+    extra: dict[str, Any] = {},
+) -> dict[str, Any]:
+    vectors = np.ascontiguousarray(vectors, dtype="<f4")
+    count, dim = vectors.shape if vectors.ndim == 2 else (0, 0)
+    hasher = hashlib.sha256()
+    sections: dict[str, list[int]] = {}
+
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(PREAMBLE.pack(MAGIC, VERSION))
+            f.write(b"\0" * (ALIGN - PREAMBLE.size))
+
+            start = f.tell()
+            data = vectors.tobytes()
+            hasher.update(data)
+            f.write(data)
+            sections["vectors"] = [start, len(data)]
+
+            start = f.tell()
+            written = 0
+            for doc in documents:
+                line = json.dumps(doc, ensure_ascii=False).encode("utf-8") + b"\n"
+                hasher.update(line)
+                f.write(line)
+                written += 1
+            sections["documents"] = [start, f.tell() - start]
+            if written != count:
+                raise ValueError(f"Snapshot has {count} vectors but {written} documents.")
+
+            footer = {
+                "version": VERSION,
+                "dim": dim,
+                "count": count,
+                "sections": sections,
+                "sha256": hasher.hexdigest(),
+                "extra": extra,
+            }
+            footer_bytes = json.dumps(footer).encode("utf-8")
+            f.write(footer_bytes)
+            f.write(TRAILER.pack(len(footer_bytes), MAGIC))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    os.replace(tmp_path, path)  # never leave a half written snapshot behind
+    return footer
+
+
+def read(path: str, verify: bool = True) -> Snapshot:
+    with open(path, "rb") as f:
+        magic, version = PREAMBLE.unpack(f.read(PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError(f"'{path}' is not a memory snapshot.")
+        if version > VERSION:
+            raise ValueError(f"Unsupported memory snapshot version {version}.")
+
+        f.seek(-TRAILER.size, os.SEEK_END)
+        footer_length, magic = TRAILER.unpack(f.read(TRAILER.size))
+        if magic != MAGIC:
+            raise ValueError(f"Memory snapshot '{path}' is truncated.")
+        f.seek(-TRAILER.size - footer_length, os.SEEK_END)
+        footer = json.loads(f.read(footer_length))
+
+        if verify:
+            hasher = hashlib.sha256()
+            for offset, length in footer["sections"].values():
+                f.seek(offset)
+                while length > 0:
+                    chunk = f.read(min(length, 1024 * 1024))
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    length -= len(chunk)
+            if hasher.hexdigest() != footer["sha256"]:
+                raise ValueError(f"Memory snapshot '{path}' failed checksum check.")
+
+    offset, _ = footer["sections"]["vectors"]
+    count, dim = footer["count"], footer["dim"]
+    if count:
+        vectors = np.memmap(
+            path, dtype="<f4", mode="r", offset=offset, shape=(count, dim)
+        )
+    else:
+        vectors = np.zeros((0, dim), dtype="<f4")
+    return Snapshot(path=path, footer=footer, vectors=vectors)
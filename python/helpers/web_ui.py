@@ -0,0 +1,410 @@
+import asyncio
+import json
+import threading
+import time
+import uuid
+from functools import wraps
+from agent import AgentContext
+from initialize import initialize
+from python.helpers import defer, hibernation, log
+from python.helpers.memory import Memory
+from python.helpers.print_style import PrintStyle
+
+# web ui request handling shared by the flask server (run_ui.py) and the asgi
+# server (run_ui_asgi.py), handlers take the request json and return the response
+
+lock = threading.Lock()
+
+# push channel timing, see events
+EVENTS_KEEPALIVE_SECONDS = 10
+EVENTS_COALESCE_SECONDS = 0.025
+EVENTS_RETRY_MS = 1000
+
+
+# get context to run agent zero in
+def get_context(ctxid: str):
+    # the lock guards creation and hibernation, an existing context is only
+    # re-checked under it, hibernation may have removed it meanwhile
+    got = AgentContext.get(ctxid) if ctxid else AgentContext.first()
+    if got:
+        with lock:
+            if AgentContext.get(got.id) is got:
+                hibernation.touch(got.id)  # not idle for the next hibernate_idle
+                return got
+    with lock:
+        if not ctxid:
+            got = AgentContext.first()
+            context = got or AgentContext(config=initialize())
+        else:
+            got = AgentContext.get(ctxid)
+            context = (
+                got
+                or hibernation.resume(ctxid)
+                or AgentContext(config=initialize(), id=ctxid)
+            )
+        hibernation.touch(context.id)
+    if not got:
+        contexts_changed()
+    return context
+
+
+# idle contexts to disk, see hibernation
+def hibernate_idle():
+    with lock:
+        count = hibernation.hibernate_idle()
+    if count:
+        contexts_changed()
+
+
+def start_hibernation():
+    hibernation.scan()
+    if not hibernation.HIBERNATE_SECONDS:
+        return
+
+    def run():
+        while True:
+            time.sleep(hibernation.CHECK_INTERVAL)
+            try:
+                hibernate_idle()
+            except Exception as e:
+                PrintStyle.error(str(e))
+
+    threading.Thread(target=run, daemon=True, name="context-hibernation").start()
+
+
+# contexts list for the ui, serialized again only when the registry version changes
+contexts_version = 0
+contexts_cache: tuple[int, str] = (-1, "[]")
+
+
+def contexts_changed():
+    # context created, removed, reset or paused
+    global contexts_version
+    contexts_version += 1
+    log.notify_changes()
+
+
+def contexts_json() -> str:
+    global contexts_cache
+    version = contexts_version
+    if contexts_cache[0] != version:
+        ctxs = [
+            {
+                "id": ctx.id,
+                "no": ctx.no,
+                "log_guid": ctx.log.guid,
+                "paused": ctx.paused,
+            }
+            for ctx in list(AgentContext._contexts.values())
+        ]
+        ctxs += list(hibernation.hibernated.values())
+        contexts_cache = (version, log.encoder.encode(ctxs))
+    return contexts_cache[1]
+
+
+def handler(func):
+    # errors are reported to the client, not raised to the server
+    # synchronous handlers read files and create contexts, they run in a thread so
+    # the agents and event streams sharing the server's loop keep going
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        try:
+            if asyncio.iscoroutinefunction(func):
+                return await func(*args, **kwargs)
+            return await asyncio.to_thread(func, *args, **kwargs)
+        except Exception as e:
+            PrintStyle.error(str(e))
+            return {
+                "ok": False,
+                "message": str(e),
+            }
+
+    return wrapper
+
+
+# send message to agent, sync waits for the result
+@handler
+async def handle_message(input: dict, sync: bool):
+    text = input.get("text", "")
+    ctxid = input.get("context", "")
+
+    # context instance - get or create, resuming or creating one reads files
+    context = await asyncio.to_thread(get_context, ctxid)
+
+    # print to console and log
+    PrintStyle(
+        background_color="#6C3483", font_color="white", bold=True, padding=True
+    ).print("User message:")
+    PrintStyle(font_color="white", padding=False).print(f"> {text}")
+    context.log.log(type="user", heading="User message", content=text)
+
+    # the agent runs on the loop thread of its context, see defer.pinned
+    with defer.pinned(context.id):
+        context.communicate(text)
+
+    if sync:
+        result = await context.process.result()  # type: ignore
+        return {
+            "ok": True,
+            "message": result,
+        }
+
+    return {
+        "ok": True,
+        "message": "Message received.",
+    }
+
+
+# pausing/unpausing the agent
+@handler
+def pause(input: dict):
+    paused = input.get("paused", False)
+    ctxid = input.get("context", "")
+
+    # context instance - get or create
+    context = get_context(ctxid)
+
+    context.paused = paused
+    contexts_changed()
+
+    return {
+        "ok": True,
+        "message": "Agent paused." if paused else "Agent unpaused.",
+        "pause": paused,
+    }
+
+
+# restarting with new agent0
+@handler
+def reset(input: dict):
+    ctxid = input.get("context", "")
+
+    # context instance - get or create
+    context = get_context(ctxid)
+    context.reset()
+    contexts_changed()
+
+    return {
+        "ok": True,
+        "message": "Agent restarted.",
+    }
+
+
+# killing context
+@handler
+def remove(input: dict):
+    ctxid = input.get("context", "")
+
+    with lock:
+        context = AgentContext.get(ctxid)
+        AgentContext.remove(ctxid)
+        hibernation.discard(ctxid)
+    if context:
+        context.log.reset()  # deletes its spill file
+    defer.EventLoopThread.release(ctxid)
+    contexts_changed()
+
+    return {
+        "ok": True,
+        "message": "Context removed.",
+    }
+
+
+# knowledge import progress and readiness, optionally retry a failed import or
+# wait for completion
+@handler
+async def knowledge_status(input: dict):
+    wait = input.get("wait", False)
+    timeout = input.get("timeout", None)
+
+    if input.get("retry", False) and Memory.failed():
+        await asyncio.to_thread(start_preload, retry=True)  # initialize reads prompts
+
+    if wait:
+        for subdir in list(Memory.preloading):
+            await Memory.wait_preload(subdir, timeout)
+
+    return {
+        "ok": True,
+        "knowledge": Memory.status(),
+        "ready": Memory.ready(),
+    }
+
+
+# older log items, paged backwards, spilled items are read from disk
+@handler
+def log_history(input: dict):
+    ctxid = input.get("context", "")
+    before = input.get("before", None)
+    limit = min(int(input.get("limit", 50)), 500)
+
+    # context instance - get or create
+    context = get_context(ctxid)
+    logs = context.log.history(before=before, limit=limit)
+
+    return {
+        "ok": True,
+        "context": context.id,
+        "log_guid": context.log.guid,
+        "logs": logs,
+    }
+
+
+# all contexts with their log versions, the ui gets the list from poll or events
+def contexts():
+    ctxs = []
+    for ctx in list(AgentContext._contexts.values()):
+        ctxs.append(
+            {
+                "id": ctx.id,
+                "no": ctx.no,
+                "log_guid": ctx.log.guid,
+                "log_version": ctx.log.version,
+                "log_length": len(ctx.log.logs),
+                "paused": ctx.paused,
+            }
+        )
+    ctxs += list(hibernation.hibernated.values())
+    return {"ok": True, "contexts_version": contexts_version, "contexts": ctxs}
+
+
+# agent loop threads with their contexts and lag, a slow context shows on its loop
+def loops():
+    return {"ok": True, "loops": defer.EventLoopThread.metrics()}
+
+
+# state of a context and its log changes after version from_no, for poll and push
+# logs are serialized items, contexts only when the client's version is outdated
+def poll_state(
+    context: AgentContext,
+    from_no: int,
+    deltas: bool = False,
+    known_contexts: int | None = None,
+):
+    state = {
+        "ok": True,
+        "context": context.id,
+        "contexts_version": contexts_version,
+        "log_guid": context.log.guid,
+        "log_version": context.log.version,
+        "log_progress": context.log.progress,
+        "log_first": context.log.first,  # older items through log_history
+        "paused": context.paused,
+        "knowledge": Memory.status(),
+        "logs": context.log.output_json(start=from_no, deltas=deltas),
+    }
+    if known_contexts != state["contexts_version"]:
+        state["contexts"] = contexts_json()
+    return state
+
+
+def encode_state(state: dict) -> str:
+    # splices the already serialized logs and contexts into the response
+    state = dict(state)
+    logs = state.pop("logs")
+    contexts = state.pop("contexts", None)
+    out = log.encoder.encode(state)[:-1]
+    out += ',"logs":[' + ",".join(logs) + "]"
+    if contexts is not None:
+        out += ',"contexts":' + contexts
+    return out + "}"
+
+
+# Web UI polling, fallback when the push channel is not available, returns json
+# blocking, async servers call apoll
+def poll(input: dict) -> str:
+    try:
+        ctxid = input.get("context", uuid.uuid4())
+        from_no = input.get("log_from", 0)
+        deltas = input.get("deltas", False)  # client merges appended text itself
+        known_contexts = input.get("contexts_version", None)
+
+        # context instance - get or create
+        context = get_context(ctxid)
+
+        return encode_state(poll_state(context, from_no, deltas, known_contexts))
+
+    except Exception as e:
+        PrintStyle.error(str(e))
+        return json.dumps({"ok": False, "message": str(e)})
+
+
+async def apoll(input: dict) -> str:
+    return await asyncio.to_thread(poll, input)
+
+
+# Web UI push channel, server sent events with the same payload as poll
+# the event id is "<log guid>:<log version>", a reconnecting EventSource sends it
+# back as Last-Event-ID and receives only the log items changed since
+class EventStream:
+    def __init__(self, ctxid: str, deltas: bool, resume: str):
+        self.context = get_context(ctxid)
+        self.deltas = deltas
+        guid, _, version = resume.partition(":")
+        same = guid == self.context.log.guid and version.isdigit()
+        self.from_no = int(version) if same else 0
+        self.log_guid = self.context.log.guid
+        self.last = None
+        self.known_contexts = None
+        self.seen = log.changes_count
+
+    def event(self) -> str | None:
+        # next event, None when nothing the client sees has changed
+        # an open stream keeps its context from hibernating
+        hibernation.touch(self.context.id)
+        if self.context.log.guid != self.log_guid:  # reset, client starts over
+            self.log_guid = self.context.log.guid
+            self.from_no = 0
+        state = poll_state(self.context, self.from_no, self.deltas, self.known_contexts)
+        summary = {k: v for k, v in state.items() if k not in ("logs", "contexts")}
+        if not state["logs"] and summary == self.last:
+            return None
+        self.from_no = state["log_version"]
+        self.known_contexts = state["contexts_version"]
+        self.last = summary
+        token = f"{state['log_guid']}:{state['log_version']}"
+        return f"id: {token}\ndata: {encode_state(state)}\n\n"
+
+    def stream(self):
+        # blocking, one server thread per client
+        yield f"retry: {EVENTS_RETRY_MS}\n\n"
+        while True:
+            event = self.event()
+            if event:
+                yield event
+            count = log.wait_for_changes(self.seen, EVENTS_KEEPALIVE_SECONDS)
+            if count == self.seen:
+                yield ": keepalive\n\n"  # also detects closed connections
+            else:
+                time.sleep(EVENTS_COALESCE_SECONDS)  # one event per burst of chunks
+                self.seen = log.changes_count
+
+    @classmethod
+    async def acreate(cls, ctxid: str, deltas: bool, resume: str) -> "EventStream":
+        # the context may be resumed from disk, not on the event loop
+        return await asyncio.to_thread(cls, ctxid, deltas, resume)
+
+    async def astream(self):
+        # on the event loop, no thread per client
+        yield f"retry: {EVENTS_RETRY_MS}\n\n"
+        while True:
+            event = self.event()
+            if event:
+                yield event
+            count = await log.await_changes(self.seen, EVENTS_KEEPALIVE_SECONDS)
+            if count == self.seen:
+                yield ": keepalive\n\n"
+            else:
+                await asyncio.sleep(EVENTS_COALESCE_SECONDS)
+                self.seen = log.changes_count
+
+
+def start_preload(retry: bool = False):
+    # import knowledge in background, the first message does not wait for it
+    config = initialize()
+    Memory.start_preload(
+        config.memory_subdir or "default",
+        config.embeddings_model,
+        config.knowledge_subdirs,
+        retry=retry,
+    )
@@ -1,12 +1,12 @@
+import asyncio
 import os
 import logging
-from agent import Agent
+from agent import Agent, AgentConfig
 from . import online_knowledge_tool
 from python.helpers import perplexity_search
 from python.helpers import duckduckgo_search
 
 from . import memory_tool
-import concurrent.futures
 
 from python.helpers.tool import Tool, Response
 from python.helpers import files
@@ -25,40 +25,7 @@ class Knowledge(Tool):
             return Response(message="No prompt provided for knowledge search", break_loop=False)
 
         try:
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                # Schedule the functions to be run in parallel
-                futures = {}
-
-                # perplexity search, if API provided
-                if os.getenv("API_KEY_PERPLEXITY"):
-                    futures['perplexity'] = executor.submit(perplexity_search.perplexity_search, prompt)
-                else: 
-                    logger.info("No API key provided for Perplexity. Skipping Perplexity search.")
-                
-                # duckduckgo search
-                futures['duckduckgo'] = executor.submit(duckduckgo_search.search, prompt)
-
-                # memory search
-                futures['memory'] = executor.submit(memory_tool.search, self.agent, prompt)
-
-                # Wait for all functions to complete
-                concurrent.futures.wait(futures.values())
-
-                results = {}
-                for key, future in futures.items():
-                    try:
-                        results[key] = future.result()
-                    except Exception as e:
-                        logger.error(f"Error in {key} search: {str(e)}")
-                        results[key] = f"Error occurred during {key} search"
-
-            perplexity_result = results.get('perplexity', "")
-            duckduckgo_result = results.get('duckduckgo', "")
-            memory_result = results.get('memory', "")
-
-            msg = files.read_file("prompts/tool.knowledge.response.md", 
-                                  online_sources = f"{perplexity_result}\n\n{duckduckgo_result}",
-                                  memory = memory_result)
+            msg = await search(self.agent.config, prompt)
 
             if self.agent.handle_intervention(msg): 
                 pass  # wait for intervention and handle it, if paused
@@ -69,3 +36,32 @@ class Knowledge(Tool):
         except Exception as e:
             logger.error(f"Error in Knowledge.execute: {str(e)}")
             return Response(message=f"An error occurred during knowledge search: {str(e)}", break_loop=False)
+
+async def search(config: AgentConfig, prompt: str) -> str:
+    # online sources and memory at once, without an agent (api.py uses it directly)
+    # the blocking search clients run in threads, the event loop stays free
+    sources = {}
+
+    # perplexity search, if API provided
+    if os.getenv("API_KEY_PERPLEXITY"):
+        sources['perplexity'] = asyncio.to_thread(perplexity_search.perplexity_search, prompt)
+    else: 
+        logger.info("No API key provided for Perplexity. Skipping Perplexity search.")
+
+    # duckduckgo search
+    sources['duckduckgo'] = asyncio.to_thread(duckduckgo_search.search, prompt)
+
+    # memory search, async on the shared Memory index
+    sources['memory'] = memory_tool.recall(config, prompt)
+
+    results = {}
+    outcomes = await asyncio.gather(*sources.values(), return_exceptions=True)
+    for key, outcome in zip(sources.keys(), outcomes):
+        if isinstance(outcome, Exception):
+            logger.error(f"Error in {key} search: {str(outcome)}")
+            outcome = f"Error occurred during {key} search"
+        results[key] = outcome
+
+    return files.read_file("prompts/tool.knowledge.response.md", 
+                           online_sources = f"{results.get('perplexity', '')}\n\n{results['duckduckgo']}",
+                           memory = results['memory'])
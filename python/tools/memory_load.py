@@ -6,9 +6,9 @@ DEFAULT_LIMIT = 10
 
 class MemoryLoad(Tool):
 
-    async def execute(self, query="", threshold=DEFAULT_THRESHOLD, limit=DEFAULT_LIMIT, filter="", **kwargs):
+    async def execute(self, query="", threshold=DEFAULT_THRESHOLD, limit=DEFAULT_LIMIT, filter="", mode=Memory.SearchMode.AUTO.value, **kwargs):
         db = await Memory.get(self.agent)
-        docs = await db.search_similarity_threshold(query=query, limit=limit, threshold=threshold, filter=filter)
+        docs = await db.search(query=query, limit=limit, threshold=threshold, filter=filter, mode=mode)
 
         if len(docs) == 0:
             result = self.agent.read_prompt("fw.memories_not_found.md", query=query)
@@ -1,25 +1,20 @@
-import json
 from functools import wraps
 import os
 from pathlib import Path
-import threading
-import uuid
-from flask import Flask, request, jsonify, Response
-from flask_basicauth import BasicAuth
-from agent import AgentContext
-from initialize import initialize
-from python.helpers.files import get_abs_path
-from python.helpers.print_style import PrintStyle
 from dotenv import load_dotenv
 
+# before the helpers, they read their settings from the environment on import
 load_dotenv()
 
+from flask import Flask, request, jsonify, Response
+from flask_basicauth import BasicAuth
+from python.helpers import log, web_ui
+from python.helpers.files import get_abs_path
+
 # initialize the internal Flask server
 app = Flask("app", static_folder=get_abs_path("./webui"), static_url_path="/")
 app.config['JSON_SORT_KEYS'] = False  # Disable key sorting in jsonify
 
-lock = threading.Lock()
-
 # Set up basic authentication, name and password from .env variables
 app.config["BASIC_AUTH_USERNAME"] = (
     os.environ.get("BASIC_AUTH_USERNAME") or "admin"
@@ -30,20 +25,6 @@ app.config["BASIC_AUTH_PASSWORD"] = (
 basic_auth = BasicAuth(app)
 
 
-# get context to run agent zero in
-def get_context(ctxid: str):
-    with lock:
-        if not ctxid:
-            first = AgentContext.first()
-            if first:
-                return first
-            return AgentContext(config=initialize())
-        got = AgentContext.get(ctxid)
-        if got:
-            return got
-        return AgentContext(config=initialize(), id=ctxid)
-
-
 # Now you can use @requires_auth function decorator to require login on certain pages
 def requires_auth(f):
     @wraps(f)
@@ -86,201 +67,82 @@ async def health_check():
 # send message to agent (async UI)
 @app.route("/msg", methods=["POST"])
 async def handle_message_async():
-    return await handle_message(False)
+    return jsonify(await web_ui.handle_message(request.get_json(), False))
 
 
 # send message to agent (synchronous API)
 @app.route("/msg_sync", methods=["POST"])
 async def handle_msg_sync():
-    return await handle_message(True)
-
-
-async def handle_message(sync: bool):
-    try:
-
-        # data sent to the server
-        input = request.get_json()
-        text = input.get("text", "")
-        ctxid = input.get("context", "")
-        blev = input.get("broadcast", 1)
-
-        # context instance - get or create
-        context = get_context(ctxid)
-
-        # print to console and log
-        PrintStyle(
-            background_color="#6C3483", font_color="white", bold=True, padding=True
-        ).print(f"User message:")
-        PrintStyle(font_color="white", padding=False).print(f"> {text}")
-        context.log.log(type="user", heading="User message", content=text)
-
-        if sync:
-            context.communicate(text)
-            result = await context.process.result()  # type: ignore
-            response = {
-                "ok": True,
-                "message": result,
-            }
-        else:
-
-            context.communicate(text)
-            response = {
-                "ok": True,
-                "message": "Message received.",
-            }
-
-    except Exception as e:
-        response = {
-            "ok": False,
-            "message": str(e),
-        }
-        PrintStyle.error(str(e))
-
-    # respond with json
-    return jsonify(response)
+    return jsonify(await web_ui.handle_message(request.get_json(), True))
 
 
 # pausing/unpausing the agent
 @app.route("/pause", methods=["POST"])
 async def pause():
-    try:
-
-        # data sent to the server
-        input = request.get_json()
-        paused = input.get("paused", False)
-        ctxid = input.get("context", "")
-
-        # context instance - get or create
-        context = get_context(ctxid)
-
-        context.paused = paused
-
-        response = {
-            "ok": True,
-            "message": "Agent paused." if paused else "Agent unpaused.",
-            "pause": paused,
-        }
-
-    except Exception as e:
-        response = {
-            "ok": False,
-            "message": str(e),
-        }
-        PrintStyle.error(str(e))
-
-    # respond with json
-    return jsonify(response)
+    return jsonify(await web_ui.pause(request.get_json()))
 
 
 # restarting with new agent0
 @app.route("/reset", methods=["POST"])
 async def reset():
-    try:
+    return jsonify(await web_ui.reset(request.get_json()))
 
-        # data sent to the server
-        input = request.get_json()
-        ctxid = input.get("context", "")
 
-        # context instance - get or create
-        context = get_context(ctxid)
-        context.reset()
+# killing context
+@app.route("/remove", methods=["POST"])
+async def remove():
+    return jsonify(await web_ui.remove(request.get_json()))
 
-        response = {
-            "ok": True,
-            "message": "Agent restarted.",
-        }
 
-    except Exception as e:
-        response = {
-            "ok": False,
-            "message": str(e),
-        }
-        PrintStyle.error(str(e))
+# knowledge import progress and readiness, optionally wait for completion
+@app.route("/knowledge_status", methods=["GET", "POST"])
+async def knowledge_status():
+    return jsonify(await web_ui.knowledge_status(request.get_json(silent=True) or {}))
 
-    # respond with json
-    return jsonify(response)
 
+# older log items, paged backwards, spilled items are read from disk
+@app.route("/log_history", methods=["POST"])
+async def log_history():
+    response = await web_ui.log_history(request.get_json())
+    # serialized with the log encoder to preserve OrderedDict order
+    return Response(
+        response=log.encoder.encode(response), status=200, mimetype="application/json"
+    )
 
-# killing context
-@app.route("/remove", methods=["POST"])
-async def remove():
-    try:
 
-        # data sent to the server
-        input = request.get_json()
-        ctxid = input.get("context", "")
+# all contexts with their log versions, the ui gets the list from /poll or /events
+@app.route("/contexts", methods=["GET", "POST"])
+async def contexts():
+    return jsonify(web_ui.contexts())
 
-        # context instance - get or create
-        AgentContext.remove(ctxid)
 
-        response = {
-            "ok": True,
-            "message": "Context removed.",
-        }
+# agent loop threads, contexts pinned to each and their lag
+@app.route("/loops", methods=["GET"])
+async def loops():
+    return jsonify(web_ui.loops())
 
-    except Exception as e:
-        response = {
-            "ok": False,
-            "message": str(e),
-        }
-        PrintStyle.error(str(e))
 
-    # respond with json
-    return jsonify(response)
+# Web UI push channel, server sent events with the same payload as /poll
+@app.route("/events", methods=["GET"])
+async def events():
+    stream = web_ui.EventStream(
+        ctxid=request.args.get("context", ""),
+        deltas=request.args.get("deltas", "") == "1",
+        resume=request.headers.get("Last-Event-ID") or request.args.get("resume", ""),
+    )
+    return Response(
+        stream.stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
-# Web UI polling
+# Web UI polling, fallback when the push channel is not available
 @app.route("/poll", methods=["POST"])
 async def poll():
-    try:
-
-        # data sent to the server
-        input = request.get_json()
-        ctxid = input.get("context", uuid.uuid4())
-        from_no = input.get("log_from", 0)
-
-        # context instance - get or create
-        context = get_context(ctxid)
-
-        logs = context.log.output(start=from_no)
-
-        # loop AgentContext._contexts
-        ctxs = []
-        for ctx in AgentContext._contexts.values():
-            ctxs.append(
-                {
-                    "id": ctx.id,
-                    "no": ctx.no,
-                    "log_guid": ctx.log.guid,
-                    "log_version": len(ctx.log.updates),
-                    "log_length": len(ctx.log.logs),
-                    "paused": ctx.paused,
-                }
-            )
-
-        # data from this server
-        response = {
-            "ok": True,
-            "context": context.id,
-            "contexts": ctxs,
-            "logs": logs,
-            "log_guid": context.log.guid,
-            "log_version": len(context.log.updates),
-            "log_progress": context.log.progress,
-            "paused": context.paused,
-        }
-
-    except Exception as e:
-        response = {
-            "ok": False,
-            "message": str(e),
-        }
-        PrintStyle.error(str(e))
-
-    # serialize json with json.dumps to preserve OrderedDict order
-    response_json = json.dumps(response)
+    # serialized with the log encoder to preserve OrderedDict order
+    response_json = web_ui.poll(request.get_json())
     return Response(response=response_json, status=200, mimetype="application/json")
-    # return jsonify(response)
 
 
 # run the internal server
@@ -293,6 +155,11 @@ if __name__ == "__main__":
         def log_request(self, code="-", size="-"):
             pass  # Override to suppress request logging
 
+    # import knowledge in background, the first message does not wait for it
+    web_ui.start_preload()
+    # idle contexts to disk, loaded back on their next request
+    web_ui.start_hibernation()
+
     # run the server on port from .env
     port = int(os.environ.get("WEB_UI_PORT", 0)) or None
     app.run(request_handler=NoRequestLoggingWSGIRequestHandler, port=port)
@@ -0,0 +1,146 @@
+import asyncio
+import os
+from pathlib import Path
+from dotenv import load_dotenv
+
+# before the helpers, they read their settings from the environment on import
+load_dotenv()
+
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+from python.helpers import log, web_ui
+from python.helpers.defer import EventLoopThread
+from python.helpers.files import get_abs_path
+
+# the web ui on an asgi server, same routes as run_ui.py
+# agents run on the server's event loop next to the requests, or on further loop
+# threads with AGENT_LOOP_THREADS > 1
+# run with: python run_ui_asgi.py  or  uvicorn run_ui_asgi:app --port <WEB_UI_PORT>
+app = FastAPI()
+
+
+async def get_json(request: Request) -> dict:
+    try:
+        return await request.json() or {}
+    except ValueError:  # GET or empty body
+        return {}
+
+
+def json_response(response: dict | str) -> Response:
+    # serialized with the log encoder to preserve OrderedDict order
+    if isinstance(response, dict):
+        response = log.encoder.encode(response)
+    return Response(content=response, media_type="application/json")
+
+
+@app.on_event("startup")
+async def startup():
+    # deferred tasks (agent processes, knowledge import) use this loop as the first of the pool
+    EventLoopThread.attach(asyncio.get_running_loop())
+    # import knowledge in background, the first message does not wait for it
+    web_ui.start_preload()
+    # idle contexts to disk, loaded back on their next request
+    web_ui.start_hibernation()
+
+
+# handle default address, show the web ui
+@app.get("/", response_class=HTMLResponse)
+async def index():
+    return await asyncio.to_thread(Path(get_abs_path("./webui/index.html")).read_text)
+
+
+# simple health check, just return OK to see the server is running
+@app.api_route("/ok", methods=["GET", "POST"])
+async def health_check():
+    return Response(content="OK", media_type="text/plain")
+
+
+# send message to agent (async UI)
+@app.post("/msg")
+async def handle_message_async(request: Request):
+    return json_response(await web_ui.handle_message(await get_json(request), False))
+
+
+# send message to agent (synchronous API)
+@app.post("/msg_sync")
+async def handle_msg_sync(request: Request):
+    return json_response(await web_ui.handle_message(await get_json(request), True))
+
+
+# pausing/unpausing the agent
+@app.post("/pause")
+async def pause(request: Request):
+    return json_response(await web_ui.pause(await get_json(request)))
+
+
+# restarting with new agent0
+@app.post("/reset")
+async def reset(request: Request):
+    return json_response(await web_ui.reset(await get_json(request)))
+
+
+# killing context
+@app.post("/remove")
+async def remove(request: Request):
+    return json_response(await web_ui.remove(await get_json(request)))
+
+
+# knowledge import progress and readiness, optionally wait for completion
+@app.api_route("/knowledge_status", methods=["GET", "POST"])
+async def knowledge_status(request: Request):
+    return json_response(await web_ui.knowledge_status(await get_json(request)))
+
+
+# older log items, paged backwards, spilled items are read from disk
+@app.post("/log_history")
+async def log_history(request: Request):
+    return json_response(await web_ui.log_history(await get_json(request)))
+
+
+# all contexts with their log versions, the ui gets the list from /poll or /events
+@app.api_route("/contexts", methods=["GET", "POST"])
+async def contexts():
+    return JSONResponse(web_ui.contexts())
+
+
+# agent loop threads, contexts pinned to each and their lag
+@app.get("/loops")
+async def loops():
+    return JSONResponse(web_ui.loops())
+
+
+# Web UI push channel, server sent events with the same payload as /poll
+# waits on the loop, an open connection does not hold a server thread
+@app.get("/events")
+async def events(request: Request):
+    stream = await web_ui.EventStream.acreate(
+        ctxid=request.query_params.get("context", ""),
+        deltas=request.query_params.get("deltas", "") == "1",
+        resume=request.headers.get("Last-Event-ID")
+        or request.query_params.get("resume", ""),
+    )
+    return StreamingResponse(
+        stream.astream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Web UI polling, fallback when the push channel is not available
+@app.post("/poll")
+async def poll(request: Request):
+    return json_response(await web_ui.apoll(await get_json(request)))
+
+
+# static files of the web ui, after the routes so they take precedence
+app.mount("/", StaticFiles(directory=get_abs_path("./webui")), name="webui")
+
+
+# run the server
+if __name__ == "__main__":
+    import uvicorn
+
+    # run the server on port from .env, request logs suppressed like in run_ui.py
+    port = int(os.environ.get("WEB_UI_PORT", 0)) or 5000
+    uvicorn.run(app, port=port, access_log=False)
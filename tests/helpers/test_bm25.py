@@ -0,0 +1,58 @@
+import unittest
+from python.helpers.bm25 import BM25Index, tokenize, is_identifier, whole_tokens
+
+
+class TestBM25(unittest.TestCase):
+    def setUp(self):
+        self.index = BM25Index()
+        self.index.add("a", "Compress files with zstd, see config.yaml for levels")
+        self.index.add("b", "Error E1042 means the SSH connection was refused")
+        self.index.add("c", "Python list comprehension examples")
+
+    def test_tokenize_keeps_identifiers(self):
+        tokens = tokenize("Open config.yaml")
+        self.assertIn("config.yaml", tokens)
+        self.assertIn("config", tokens)
+        self.assertIn("yaml", tokens)
+
+    def test_is_identifier(self):
+        self.assertTrue(is_identifier("config.yaml"))
+        self.assertTrue(is_identifier("E1042"))
+        self.assertTrue(is_identifier("32cd37ff-101f-4112-80e2-33b795548116"))
+        self.assertFalse(is_identifier("how to compress files"))
+        self.assertFalse(is_identifier("compression"))
+
+    def test_whole_tokens(self):
+        self.assertEqual(whole_tokens("Open config.yaml"), ["open", "config.yaml"])
+        self.assertTrue(self.index.has_terms("a", whole_tokens("config.yaml")))
+        # parts alone are not the identifier
+        self.index.add("d", "the config of yaml parsers")
+        self.assertFalse(self.index.has_terms("d", whole_tokens("config.yaml")))
+        self.assertTrue(self.index.has_terms("d", []))
+
+    def test_search_exact_identifier(self):
+        hits = self.index.search("E1042", limit=5)
+        self.assertEqual([id for id, _ in hits], ["b"])
+
+    def test_search_ranking(self):
+        hits = self.index.search("compress config.yaml", limit=5)
+        self.assertEqual(hits[0][0], "a")
+
+    def test_search_accept_filter(self):
+        hits = self.index.search("E1042", limit=5, accept=lambda id: id != "b")
+        self.assertEqual(hits, [])
+
+    def test_remove(self):
+        self.index.remove(["b"])
+        self.assertEqual(self.index.search("E1042", limit=5), [])
+        self.assertEqual(len(self.index), 2)
+        self.assertNotIn("e1042", self.index.postings)
+
+    def test_readd_replaces(self):
+        self.index.add("c", "Rust iterators")
+        self.assertEqual(self.index.search("python", limit=5), [])
+        self.assertEqual(self.index.search("rust", limit=5)[0][0], "c")
+
+
+if __name__ == '__main__':
+    unittest.main()
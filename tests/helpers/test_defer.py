@@ -0,0 +1,86 @@
+import asyncio
+import threading
+import unittest
+from python.helpers import defer
+from python.helpers.defer import DeferredTask, EventLoopThread
+
+
+async def sleep_and_return(value, seconds=0.1):
+    await asyncio.sleep(seconds)
+    return value
+
+
+async def fail():
+    raise ValueError("failed")
+
+
+class TestDeferredTask(unittest.TestCase):
+    def test_result_holds_no_threads(self):
+        async def wait():
+            DeferredTask(sleep_and_return, 0, 0).result_sync()  # loop thread started
+            threads = threading.active_count()
+            tasks = [DeferredTask(sleep_and_return, i) for i in range(100)]
+            results = await asyncio.gather(*(task.result() for task in tasks))
+            self.assertEqual(results, list(range(100)))
+            self.assertEqual(threading.active_count(), threads)
+
+        asyncio.run(wait())
+
+    def test_timeout_keeps_task_running(self):
+        async def wait():
+            task = DeferredTask(sleep_and_return, "done", 0.2)
+            with self.assertRaises(TimeoutError):
+                await task.result(timeout=0.01)
+            self.assertEqual(await task.result(), "done")
+
+        asyncio.run(wait())
+
+    def test_exception(self):
+        async def wait():
+            with self.assertRaises(ValueError):
+                await DeferredTask(fail).result()
+
+        asyncio.run(wait())
+
+
+async def loop_index():
+    return EventLoopThread.current().index  # type: ignore
+
+
+class TestEventLoopThreads(unittest.TestCase):
+    def setUp(self):
+        self.threads, self.assign = defer.LOOP_THREADS, defer.LOOP_ASSIGN
+        defer.LOOP_THREADS = 3
+
+    def tearDown(self):
+        defer.LOOP_THREADS, defer.LOOP_ASSIGN = self.threads, self.assign
+        for key in ("a", "b", "c", "d"):
+            EventLoopThread.release(key)
+
+    def test_pinned_by_hash(self):
+        defer.LOOP_ASSIGN = "hash"
+        with defer.pinned("a"):
+            first = DeferredTask(loop_index).result_sync()
+            second = DeferredTask(loop_index).result_sync()
+        self.assertEqual(first, second)
+        self.assertEqual(first, EventLoopThread.for_key("a").index)
+
+    def test_least_load(self):
+        defer.LOOP_ASSIGN = "least_load"
+        indexes = {EventLoopThread.for_key(key).index for key in ("a", "b", "c")}
+        self.assertEqual(indexes, {0, 1, 2})
+        EventLoopThread.release("b")
+        self.assertNotIn(
+            EventLoopThread.for_key("d").index,
+            {EventLoopThread.for_key("a").index, EventLoopThread.for_key("c").index},
+        )
+
+    def test_metrics(self):
+        loop = EventLoopThread.for_key("a")
+        metrics = {m["loop"]: m for m in EventLoopThread.metrics()}
+        self.assertGreaterEqual(metrics[loop.index]["contexts"], 1)
+        self.assertIn("lag_ms", metrics[loop.index])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from python.helpers.file_watcher import FileWatcher
+
+
+class TestFileWatcher(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.changes: list[set[str]] = []
+        self.event = threading.Event()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def callback(self, paths):
+        self.changes.append(paths)
+        self.event.set()
+
+    def watch(self, **kwargs):
+        watcher = FileWatcher(
+            [self.dir.name], self.callback, debounce=0.2, poll_interval=0.1, **kwargs
+        )
+        watcher.start()
+        self.addCleanup(watcher.stop)
+        return watcher
+
+    def write(self, *parts):
+        path = os.path.join(self.dir.name, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write("content")
+        return path
+
+    def test_debounced_changes(self):
+        self.watch()
+        first = self.write("a.md")
+        second = self.write("sub", "b.md")
+        self.assertTrue(self.event.wait(5))
+        changed = set().union(*self.changes)
+        self.assertIn(first, changed)
+        self.assertIn(second, changed)
+
+    def test_removed_file(self):
+        path = self.write("a.md")
+        self.watch()
+        os.remove(path)
+        self.assertTrue(self.event.wait(5))
+        self.assertIn(path, set().union(*self.changes))
+
+    def test_root_created_later(self):
+        root = os.path.join(self.dir.name, "custom", "main")
+        watcher = FileWatcher([root], self.callback, debounce=0.2)
+        watcher.start()
+        self.addCleanup(watcher.stop)
+        path = self.write("custom", "main", "a.md")
+        self.assertTrue(self.event.wait(5))
+        self.assertIn(path, set().union(*self.changes))
+
+        self.event.clear()
+        later = self.write("custom", "main", "b.md")
+        self.assertTrue(self.event.wait(5))
+        self.assertIn(later, set().union(*self.changes))
+        outside = self.write("custom", "other.md")  # parent only watched for the root
+        self.event.clear()
+        self.assertFalse(self.event.wait(0.5))
+        self.assertNotIn(outside, set().union(*self.changes))
+
+    def test_root_removed_and_created_again(self):
+        root = os.path.join(self.dir.name, "main")
+        os.makedirs(root)
+        watcher = FileWatcher([root], self.callback, debounce=0.2)
+        watcher.start()
+        self.addCleanup(watcher.stop)
+        os.rmdir(root)
+        path = self.write("main", "a.md")
+        deadline = time.monotonic() + 5
+        while path not in set().union(*self.changes) and time.monotonic() < deadline:
+            self.event.wait(0.1)
+        self.assertIn(path, set().union(*self.changes))
+
+    def test_polling_fallback(self):
+        watcher = self.watch(force_polling=True)
+        self.assertEqual(watcher.mode, "polling")
+        path = self.write("a.md")
+        self.assertTrue(self.event.wait(5))
+        self.assertIn(path, set().union(*self.changes))
+
+
+if __name__ == '__main__':
+    unittest.main()
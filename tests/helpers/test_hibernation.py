@@ -0,0 +1,198 @@
+import json
+import os
+import tempfile
+import unittest
+import uuid
+from unittest import mock
+import agent
+from agent import Agent
+from langchain_core.messages import AIMessage, HumanMessage
+from python.helpers import files
+from python.helpers.log import Log, spill_path
+
+# replaced by FakeContext below, the modules bind the name on import
+with mock.patch.object(agent, "AgentContext", create=True):
+    from python.helpers import hibernation, web_ui
+
+
+class FakeAgent(Agent):
+    # the state hibernation keeps, without reading prompts or changing directory
+    def __init__(self, number: int, config, context=None):
+        self.number = number
+        self.config = config
+        self.history = []
+        self.last_message = ""
+        self.intervention_message = ""
+        self.intervention_status = False
+        self.data = {}
+        self.listeners = []
+
+
+class FakeContext:
+    # the registry of AgentContext that web_ui and hibernation use
+    _contexts: dict[str, "FakeContext"] = {}
+    _counter = 0
+
+    def __init__(self, config, id: str | None = None):
+        FakeContext._counter += 1
+        self.id = id or str(uuid.uuid4())
+        self.no = FakeContext._counter
+        self.config = config
+        self.log = Log()
+        self.paused = False
+        self.process = None
+        self.agent0 = FakeAgent(0, config, self)
+        FakeContext._contexts[self.id] = self
+
+    @staticmethod
+    def get(id: str):
+        return FakeContext._contexts.get(id)
+
+    @staticmethod
+    def first():
+        return next(iter(FakeContext._contexts.values()), None)
+
+    @staticmethod
+    def remove(id: str):
+        return FakeContext._contexts.pop(id, None)
+
+
+class HibernationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        for patcher in (
+            mock.patch.object(files, "get_base_dir", lambda: self.dir.name),
+            mock.patch.object(hibernation, "AgentContext", FakeContext),
+            mock.patch.object(web_ui, "AgentContext", FakeContext),
+            mock.patch.object(hibernation, "Agent", FakeAgent),
+            mock.patch.object(hibernation, "initialize", lambda: "config"),
+            mock.patch.object(web_ui, "initialize", lambda: "config"),
+            mock.patch.dict(FakeContext._contexts, clear=True),
+            mock.patch.dict(hibernation.hibernated, clear=True),
+            mock.patch.dict(hibernation.last_used, clear=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def context(self) -> FakeContext:
+        # a conversation with a subordinate and a few log items
+        context = FakeContext("config")
+        agent0 = context.agent0
+        agent0.history = [HumanMessage(content="find the file"), AIMessage(content="on it")]
+        agent0.last_message = "on it"
+        agent0.set_data("plan", ["search", "report"])
+        subordinate = FakeAgent(1, "config", context)
+        subordinate.history = [HumanMessage(content="search the disk")]
+        subordinate.set_data("superior", agent0)
+        agent0.set_data("subordinate", subordinate)
+        for i in range(3):
+            context.log.log(type="info", heading=f"step {i}")
+        return context
+
+    def assert_restored(self, context: FakeContext, original: FakeContext, log: list):
+        self.assertIsNot(context, original)
+        self.assertEqual(context.id, original.id)
+        self.assertIs(FakeContext.get(original.id), context)
+        self.assertEqual(context.log.guid, original.log.guid)
+        self.assertEqual(context.log.output(), log)
+
+        agent0 = context.agent0
+        self.assertEqual(
+            [(m.type, m.content) for m in agent0.history],
+            [("human", "find the file"), ("ai", "on it")],
+        )
+        self.assertEqual(agent0.last_message, "on it")
+        self.assertEqual(agent0.get_data("plan"), ["search", "report"])
+        subordinate = agent0.get_data("subordinate")
+        self.assertEqual(subordinate.number, 1)
+        self.assertIs(subordinate.get_data("superior"), agent0)
+        self.assertEqual(
+            [(m.type, m.content) for m in subordinate.history],
+            [("human", "search the disk")],
+        )
+
+
+class TestHibernation(HibernationTestCase):
+    def test_round_trip(self):
+        context = self.context()
+        log = context.log.output()
+        self.assertTrue(hibernation.hibernate(context))
+        self.assertIsNone(FakeContext.get(context.id))
+        self.assertEqual(context.agent0.history, [])  # reset, shells closed
+
+        # summary line only, for the contexts list
+        with open(hibernation._path(context.id), encoding="utf-8") as f:
+            summary = json.loads(f.readline())
+        self.assertEqual(summary, hibernation.hibernated[context.id])
+        self.assertEqual(summary["log_guid"], context.log.guid)
+
+        resumed = hibernation.resume(context.id)
+        self.assert_restored(resumed, context, log)
+        self.assertFalse(os.path.exists(hibernation._path(context.id)))
+        self.assertNotIn(context.id, hibernation.hibernated)
+        self.assertIsNone(hibernation.resume(context.id))
+
+    def test_resume_after_restart(self):
+        context = self.context()
+        log = context.log.output()
+        hibernation.hibernate(context)
+        hibernation.hibernated.clear()
+        hibernation.scan()
+        self.assertEqual(list(hibernation.hibernated), [context.id])
+        self.assert_restored(hibernation.resume(context.id), context, log)
+
+    def test_busy_context_stays(self):
+        context = self.context()
+        context.process = mock.Mock(is_alive=lambda: True)
+        self.assertFalse(hibernation.hibernate(context))
+        self.assertIs(FakeContext.get(context.id), context)
+        self.assertEqual(hibernation.hibernated, {})
+
+    def test_discard(self):
+        context = self.context()
+        path = spill_path(context.log.guid)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "w").close()
+        hibernation.hibernate(context)
+        hibernation.discard(context.id)
+        self.assertFalse(os.path.exists(hibernation._path(context.id)))
+        self.assertFalse(os.path.exists(path))
+        self.assertIsNone(hibernation.resume(context.id))
+
+
+class TestGetContext(HibernationTestCase):
+    def test_resumes_hibernated_context(self):
+        context = self.context()
+        log = context.log.output()
+        hibernation.hibernate(context)
+        self.assert_restored(web_ui.get_context(context.id), context, log)
+
+    def test_context_hibernated_before_the_lock(self):
+        # hibernate_idle runs between the lookup and the lock, the stale
+        # context must not be handed out
+        context = self.context()
+        log = context.log.output()
+        lookups = []
+
+        def get(id: str):
+            got = FakeContext._contexts.get(id)
+            if not lookups:
+                hibernation.hibernate(got)
+            lookups.append(id)
+            return got
+
+        with mock.patch.object(FakeContext, "get", staticmethod(get)):
+            got = web_ui.get_context(context.id)
+        self.assert_restored(got, context, log)
+        self.assertIn(context.id, hibernation.last_used)
+
+    def test_existing_context(self):
+        context = self.context()
+        self.assertIs(web_ui.get_context(context.id), context)
+        self.assertIs(web_ui.get_context(""), context)
+        self.assertIn(context.id, hibernation.last_used)
+
+
+if __name__ == '__main__':
+    unittest.main()
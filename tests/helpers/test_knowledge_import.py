@@ -0,0 +1,156 @@
+import asyncio
+import os
+import re
+import tempfile
+import unittest
+from contextlib import aclosing
+from unittest import mock
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from python.helpers import knowledge_import
+
+
+class TestTextChunks(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "words.txt")
+        self.splitter = RecursiveCharacterTextSplitter(chunk_size=60, chunk_overlap=0)
+
+    def chunks(self, text: str, block_size: int) -> list[str]:
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(text)
+        with mock.patch.object(knowledge_import, "TEXT_BLOCK_SIZE", block_size):
+            return list(knowledge_import.iter_text_chunks(self.path, self.splitter))
+
+    def test_no_words_merge_at_block_boundaries(self):
+        words = ["alpha", "beta", "gamma", "delta", "zeta", "eta", "theta."]
+        lines = [" ".join(words[i % 7 :] + words[: i % 7]) for i in range(40)]
+        text = "\n".join(lines)
+        chunks = self.chunks(text, block_size=37)  # boundaries fall inside and between words
+        self.assertGreater(len(chunks), 10)
+        for chunk in chunks:
+            self.assertLessEqual(set(re.findall(r"\S+", chunk)), set(words))
+        self.assertEqual(
+            re.findall(r"\S+", " ".join(chunks)), re.findall(r"\S+", text)
+        )
+
+    def test_multibyte_text_across_blocks(self):
+        text = "héllo wörld 😀 " * 50
+        chunks = self.chunks(text, block_size=7)
+        self.assertEqual(" ".join(chunks).split(), text.split())
+
+    def test_last_block_split_whole(self):
+        text = "words in a single block"
+        self.assertEqual(self.chunks(text, block_size=64), [text])
+        self.assertEqual(self.chunks(text, block_size=len(text)), [text])
+
+    def test_text_without_breaks(self):
+        text = "x" * 500
+        self.assertEqual("".join(self.chunks(text, block_size=64)), text)
+
+
+class TestParseFiles(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.items = []
+        for i in range(4):
+            path = os.path.join(self.dir.name, f"file{i}.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"knowledge of file {i}")
+            self.items.append((path, {"area": "main"}))
+        self.bad = os.path.join(self.dir.name, "bad.txt")
+        os.mkdir(self.bad)  # listed as a file, cannot be read
+
+    def parse(self, workers: int) -> dict:
+        async def run():
+            results = {}
+            items = self.items[:2] + [(self.bad, {})] + self.items[2:]
+            async for file, batches in knowledge_import.parse_files(items, workers):
+                try:
+                    results[file] = [
+                        doc.page_content async for batch in batches for doc in batch
+                    ]
+                except OSError as e:
+                    results[file] = e
+            return results
+
+        return asyncio.run(run())
+
+    def assert_bad_file_skipped(self, results: dict):
+        self.assertIsInstance(results.pop(self.bad), OSError)
+        self.assertEqual(
+            results,
+            {path: [f"knowledge of file {i}"] for i, (path, _) in enumerate(self.items)},
+        )
+
+    def test_failed_file_in_thread(self):
+        self.assert_bad_file_skipped(self.parse(workers=1))
+
+    def test_failed_file_in_worker_process(self):
+        self.assert_bad_file_skipped(self.parse(workers=2))
+
+    def test_consumer_stops_early(self):
+        async def run():
+            async with aclosing(knowledge_import.parse_files(self.items, 2)) as parsed:
+                async for file, batches in parsed:
+                    return file
+
+        # queued files are dropped, running workers are not waited for
+        file = asyncio.run(asyncio.wait_for(run(), 60))
+        self.assertIn(file, [path for path, _ in self.items])
+
+
+class TestFileChanged(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "notes.txt")
+        self.write("first version")
+
+    def write(self, text: str):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def test_new_file(self):
+        data = {}
+        self.assertTrue(knowledge_import.is_file_changed(self.path, data))
+        stat = os.stat(self.path)
+        self.assertEqual((data["size"], data["mtime"]), (stat.st_size, stat.st_mtime_ns))
+        self.assertEqual(data["checksum"], knowledge_import.calculate_checksum(self.path))
+
+    def test_same_size_and_mtime_skip_hashing(self):
+        data = {}
+        knowledge_import.is_file_changed(self.path, data)
+        with mock.patch.object(
+            knowledge_import, "calculate_checksum", side_effect=AssertionError
+        ):
+            self.assertFalse(knowledge_import.is_file_changed(self.path, data))
+
+    def test_touched_file_is_hashed(self):
+        data = {}
+        knowledge_import.is_file_changed(self.path, data)
+        mtime = data["mtime"] + 10**9
+        os.utime(self.path, ns=(mtime, mtime))
+        self.assertFalse(knowledge_import.is_file_changed(self.path, data))
+        self.assertEqual(data["mtime"], mtime)
+
+        self.write("other version")  # same size
+        os.utime(self.path, ns=(mtime, mtime))
+        data["mtime"] -= 1
+        self.assertTrue(knowledge_import.is_file_changed(self.path, data))
+
+    def test_legacy_md5_entry(self):
+        # index entries from before size and mtime were stored
+        md5 = knowledge_import.calculate_checksum(self.path, legacy=True)
+        data = {"checksum": md5}
+        self.assertFalse(knowledge_import.is_file_changed(self.path, data))
+        self.assertEqual(data["checksum"], knowledge_import.calculate_checksum(self.path))
+        self.assertIn("size", data)
+
+        self.write("changed since")
+        self.assertTrue(knowledge_import.is_file_changed(self.path, {"checksum": md5}))
+
+
+if __name__ == '__main__':
+    unittest.main()
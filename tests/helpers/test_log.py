@@ -0,0 +1,176 @@
+import asyncio
+import json
+import sys
+import threading
+import unittest
+from python.helpers import log
+from python.helpers.log import Log
+
+
+class TestLog(unittest.TestCase):
+    def test_output_since_version(self):
+        log = Log()
+        first = log.log(type="info", heading="first")
+        second = log.log(type="info", heading="second")
+        version = log.version
+        first.stream(content="a")
+        first.stream(content="b")
+        out = log.output(start=version)
+        self.assertEqual([item["no"] for item in out], [first.no])
+        self.assertEqual(out[0]["content"], "ab")
+        self.assertEqual(
+            [item["no"] for item in log.output()], [first.no, second.no]
+        )
+        self.assertEqual(log.output(start=log.version), [])
+
+    def test_updates_bounded_by_items(self):
+        log = Log()
+        item = log.log(type="response")
+        for _ in range(2000):
+            item.stream(content="x")
+        self.assertEqual(len(log.updates), 1)
+        self.assertEqual(log.version, 2001)
+
+    def test_stream_fields(self):
+        log = Log()
+        item = log.log(type="code_exe", heading="run", kvps={"code": "ls"})
+        item.stream(heading=" 1", content="a", code=" -la", output="x")
+        item.stream(content="b", output="y")
+        out = item.output()
+        self.assertEqual(out["heading"], "run 1")
+        self.assertEqual(out["content"], "ab")
+        self.assertEqual(dict(out["kvps"]), {"code": "ls -la", "output": "xy"})
+        self.assertEqual(log.progress, "run 1")
+        item.stream(content="c")
+        item.update(content="new")
+        self.assertEqual(item.output()["content"], "new")
+
+    def test_output_deltas(self):
+        log = Log()
+        item = log.log(type="code_exe", heading="run", content="ab", kvps={"code": "ls"})
+        version = log.version
+        item.stream(content="cd", output="x")
+        item.stream(content="ef")
+        out = log.output(start=version, deltas=True)[0]
+        self.assertEqual(out["content"], "cdef")
+        self.assertEqual(out["heading"], "")
+        self.assertEqual(out["kvps"], {"code": "", "output": "x"})
+        self.assertEqual(
+            out["deltas"], {"heading": 3, "content": 2, "kvps": {"code": 2}}
+        )
+
+        version = log.version
+        item.update(content="new")
+        out = log.output(start=version, deltas=True)[0]
+        self.assertEqual(out["content"], "new")
+        self.assertNotIn("content", out["deltas"])
+        self.assertNotIn("deltas", log.output(deltas=True)[0])
+
+    def test_deltas_in_utf16_units(self):
+        # offsets continue the client's javascript strings
+        log = Log()
+        item = log.log(type="response", content="a😀")
+        version = log.version
+        item.stream(content="é🎉", output="🚀")
+        item.stream(output="x")
+        version_after = log.version
+        item.stream(content="b")
+        out = log.output(start=version, deltas=True)[0]
+        self.assertEqual(out["content"], "é🎉b")
+        self.assertEqual(out["deltas"]["content"], 3)
+        out = log.output(start=version_after, deltas=True)[0]
+        self.assertEqual(out["content"], "b")
+        self.assertEqual(out["deltas"]["content"], 6)
+        self.assertEqual(out["kvps"]["output"], "")
+        self.assertEqual(out["deltas"]["kvps"]["output"], 3)
+
+    def test_spill_and_history(self):
+        log = Log()
+        log.MEMORY_ITEMS, log.SPILL_BATCH = 4, 2
+        self.addCleanup(log.reset)
+        items = [log.log(type="info", heading=f"item {i}") for i in range(10)]
+        self.assertEqual(log.first, 6)
+        self.assertIsNone(log.logs[0])
+        self.assertEqual(len(log.output()), 4)
+
+        history = log.history(before=6, limit=3)
+        self.assertEqual([item["heading"] for item in history], ["item 3", "item 4", "item 5"])
+
+        items[1].stream(content="late")  # restored from the spill file
+        self.assertEqual(log.logs[1].heading, "item 1")
+        self.assertEqual(log.history(before=2, limit=1)[0]["content"], "late")
+        for i in range(4):
+            log.log(type="info")
+        self.assertIsNone(log.logs[1])
+        self.assertEqual(log.history(before=2, limit=1)[0]["content"], "late")
+
+    def test_dump_and_load(self):
+        log = Log()
+        self.addCleanup(log.reset)
+        items = [log.log(type="info", heading=f"item {i}") for i in range(10)]
+        items[8].stream(content="streamed")
+        data = json.loads(json.dumps(log.dump(tail=3)))
+        self.assertEqual(len(data["items"]), 3)
+
+        loaded = Log.load(data)
+        self.assertEqual((loaded.guid, loaded.version), (log.guid, log.version))
+        self.assertEqual(loaded.output(start=log.version), [])
+        self.assertEqual(loaded.output(start=9)[0]["content"], "streamed")
+        self.assertEqual(
+            [item["heading"] for item in loaded.history(before=3, limit=2)],
+            ["item 1", "item 2"],
+        )
+        loaded.logs[9].stream(content="more")
+        self.assertEqual([item["no"] for item in loaded.output(start=log.version)], [9])
+
+    def test_await_changes(self):
+        async def wait():
+            seen = log.changes_count
+            threading.Timer(0.05, log.notify_changes).start()
+            self.assertEqual(await log.await_changes(seen, 5), seen + 1)
+            self.assertEqual(await log.await_changes(seen + 1, 0.05), seen + 1)
+
+        asyncio.run(wait())
+        self.assertEqual(log.async_waiters, set())
+
+    def test_stream_from_threads(self):
+        log = Log()
+        item = log.log(type="response")
+        stop = threading.Event()
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # switch threads mid update
+        self.addCleanup(sys.setswitchinterval, interval)
+
+        def read():
+            while not stop.is_set():
+                log.output(deltas=True)
+
+        def write(key: str):
+            for _ in range(2000):
+                item.stream(content="x", **{key: "y"})
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        writers = [threading.Thread(target=write, args=(f"k{i}",)) for i in range(4)]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+        stop.set()
+        reader.join()
+
+        out = item.output()
+        self.assertEqual(len(out["content"]), 8000)
+        self.assertEqual([len(v) for v in out["kvps"].values()], [2000] * 4)
+
+    def test_reset(self):
+        log = Log()
+        item = log.log(type="info")
+        log.reset()
+        item.update(content="stale")
+        self.assertEqual(log.version, 0)
+        self.assertEqual(log.output(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
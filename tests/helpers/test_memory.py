@@ -0,0 +1,359 @@
+import asyncio
+import hashlib
+import math
+import os
+import re
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from python.helpers import files
+from python.helpers.memory import Memory
+
+try:
+    import chromadb
+except ImportError:
+    chromadb = None
+
+
+class FakeEmbeddings(Embeddings):
+    # words hashed into a few dimensions, texts sharing words are similar
+    model = "fake"
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        vector = [0.0] * 32
+        for word in re.findall(r"\w+", text.lower()):
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % 32] += 1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+
+class MemoryTestCase(unittest.TestCase):
+    # subdirs in a temporary directory, embeddings cached in memory
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        get_embedder = Memory._get_embedder
+        for patcher in (
+            mock.patch.object(
+                Memory,
+                "_abs_db_dir",
+                staticmethod(lambda subdir: os.path.join(self.dir.name, subdir)),
+            ),
+            mock.patch.object(
+                Memory,
+                "_get_embedder",
+                staticmethod(lambda model, in_memory=False: get_embedder(model, True)),
+            ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.unload_all)
+        self.embeddings = FakeEmbeddings()
+
+    def unload_all(self):
+        for subdir in list(Memory.index):
+            Memory.unload(subdir)
+
+    def run_async(self, coro):
+        return asyncio.run(coro)
+
+    async def get(self, subdir: str = "test") -> Memory:
+        return await Memory.get_by_subdir(subdir, self.embeddings)
+
+
+class TestReload(MemoryTestCase):
+    def test_load_unload_reload(self):
+        async def run():
+            memory = await self.get()
+            id = await memory.insert_text("the quick brown fox")
+            self.assertEqual(len(memory.lexical), 1)
+
+            Memory.unload("test")
+            self.assertNotIn("test", Memory.index)
+            self.assertNotIn("test", Memory.lexical_indexes)
+
+            # the held wrapper loads the subdir again before searching
+            docs = await memory.search_keyword("fox", 5)
+            self.assertEqual([doc.metadata["id"] for doc in docs], [id])
+            self.assertIs(memory.db, Memory.index["test"])
+            self.assertIs(memory.lexical, Memory.lexical_indexes["test"])
+
+            again = await self.get()
+            self.assertIs(again.db, memory.db)
+
+        self.run_async(run())
+
+    def test_empty_lexical_index_is_registered_one(self):
+        async def run():
+            memory = await self.get()
+            self.assertEqual(len(Memory.lexical_indexes["test"]), 0)
+            self.assertIs(memory.lexical, Memory.lexical_indexes["test"])
+            Memory.unload("test")
+            await self.get()
+            self.assertIs(memory.lexical, Memory.lexical_indexes["test"])
+
+        self.run_async(run())
+
+
+class TestUpsertBatch(MemoryTestCase):
+    def test_replaces_existing_and_batch_duplicates(self):
+        async def run():
+            memory = await self.get()
+            [old], _ = await memory.upsert_batch(["user likes green tea"], "fragments")
+
+            ids, removed = await memory.upsert_batch(
+                [
+                    "user likes green tea",  # replaces the stored one
+                    "server runs on port 8080",  # replaced by the next item
+                    "server runs on port 8080",
+                ],
+                "fragments",
+            )
+            self.assertEqual(len(ids), 2)
+            self.assertEqual(set(memory.db.docstore._dict), set(ids))
+            removed_ids = [doc.metadata["id"] for doc in removed]
+            self.assertEqual(len(removed_ids), 2)
+            self.assertIn(old, removed_ids)
+            duplicate = [doc for doc in removed if doc.metadata["id"] != old][0]
+            self.assertEqual(duplicate.page_content, "server runs on port 8080")
+            self.assertNotIn(duplicate.metadata["id"], ids)
+            self.assertEqual(len(memory.lexical), 2)
+
+        self.run_async(run())
+
+    def test_other_area_is_kept(self):
+        async def run():
+            memory = await self.get()
+            [main], _ = await memory.upsert_batch(["user likes green tea"], "main")
+            ids, removed = await memory.upsert_batch(["user likes green tea"], "fragments")
+            self.assertEqual(removed, [])
+            self.assertEqual(set(memory.db.docstore._dict), {main, *ids})
+
+        self.run_async(run())
+
+
+class TestSnapshot(MemoryTestCase):
+    def test_export_and_import(self):
+        path = os.path.join(self.dir.name, "memory.snapshot")
+
+        async def run():
+            memory = await self.get("source")
+            id = await memory.insert_text("the blue door is locked")
+            await memory.export_snapshot(path)
+
+            target = await self.get("target")
+            await target.insert_text("replaced by the snapshot")
+            Memory.preloaded.add("target")
+            watcher = mock.Mock()
+            Memory.watchers["target"] = watcher
+
+            imported = await Memory.import_snapshot(path, "target", self.embeddings)
+            self.assertEqual(set(imported.db.docstore._dict), {id})
+            self.assertIs(target.db, Memory.index["target"])  # held wrappers follow
+            docs = await target.search_keyword("door", 5)
+            self.assertEqual([doc.metadata["id"] for doc in docs], [id])
+            # knowledge is checked again against the imported index
+            self.assertNotIn("target", Memory.preloaded)
+            self.assertNotIn("target", Memory.watchers)
+            watcher.stop.assert_called_once()
+
+        self.run_async(run())
+
+    def test_import_waits_for_knowledge_import(self):
+        path = os.path.join(self.dir.name, "memory.snapshot")
+
+        async def run():
+            memory = await self.get("source")
+            await memory.insert_text("snapshot text")
+            await memory.export_snapshot(path)
+
+            order = []
+
+            async def knowledge_import():
+                async with Memory._import_lock("target"):
+                    await asyncio.sleep(0.1)
+                    order.append("knowledge")
+
+            task = asyncio.create_task(knowledge_import())
+            await asyncio.sleep(0.01)
+            await Memory.import_snapshot(path, "target", self.embeddings)
+            order.append("snapshot")
+            await task
+            self.assertEqual(order, ["knowledge", "snapshot"])
+
+        self.run_async(run())
+
+
+class TestImportLock(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(Memory.import_locks.pop, "shared", None)
+
+    async def hold(self, active: list, seen: list, seconds: float = 0.05):
+        async with Memory._import_lock("shared"):
+            active.append(threading.get_ident())
+            seen.append(len(active))
+            await asyncio.sleep(seconds)
+            active.pop()
+
+    def test_shared_across_loops(self):
+        # contexts on different pool loops import into one subdir
+        active, seen = [], []
+        threads = [
+            threading.Thread(target=asyncio.run, args=(self.hold(active, seen),))
+            for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(seen, [1, 1, 1])
+
+    def test_cancelled_waiter_releases(self):
+        async def run():
+            active, seen = [], []
+            async with Memory._import_lock("shared"):
+                waiter = asyncio.create_task(self.hold(active, seen))
+                await asyncio.sleep(0.05)
+                waiter.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await waiter
+            # the waiting thread takes the lock after all and hands it back
+            await asyncio.wait_for(self.hold(active, seen, 0), 5)
+            self.assertEqual(seen, [1])
+
+        asyncio.run(run())
+
+
+class TestAutoSearch(MemoryTestCase):
+    def test_identifier_fast_path(self):
+        async def run():
+            memory = await self.get()
+            id = await memory.insert_text("levels are set in config.yaml")
+            await memory.insert_text("the config of yaml parsers")
+            with mock.patch.object(
+                Memory, "search_similarity_threshold", side_effect=AssertionError
+            ):
+                docs = await memory.search("config.yaml", limit=5, threshold=0.1)
+            self.assertEqual([doc.metadata["id"] for doc in docs], [id])
+
+        self.run_async(run())
+
+    def test_missing_identifier_falls_through(self):
+        # only parts of the identifier match, vector search decides
+        async def run():
+            memory = await self.get()
+            await memory.insert_text("the config of yaml parsers")
+            with mock.patch.object(
+                Memory, "search_similarity_threshold", return_value=[]
+            ) as vector:
+                docs = await memory.search("settings.yaml", limit=5, threshold=0.1)
+            self.assertEqual(docs, [])
+            vector.assert_called_once()
+
+        self.run_async(run())
+
+
+class TestReimportFile(MemoryTestCase):
+    async def batches(self, *batches: list[str], error: Exception | None = None):
+        for batch in batches:
+            yield [Document(text, metadata={"area": "main"}) for text in batch]
+        if error:
+            raise error
+
+    def test_unchanged_chunks_keep_ids(self):
+        async def run():
+            memory = await self.get()
+            file_data = {}
+            counts = await memory._reimport_file(
+                file_data, self.batches(["chunk one", "chunk two"], ["chunk three"])
+            )
+            self.assertEqual(counts, (3, 3))
+            first = list(file_data["ids"])
+
+            with mock.patch.object(memory, "_embed", wraps=memory._embed) as embed:
+                counts = await memory._reimport_file(
+                    file_data, self.batches(["chunk one", "chunk 2 changed"], ["chunk three"])
+                )
+            self.assertEqual(counts, (3, 1))
+            embedded = [text for call in embed.call_args_list for text in call.args[0]]
+            self.assertEqual(embedded, ["chunk 2 changed"])
+            ids = file_data["ids"]
+            self.assertEqual((ids[0], ids[2]), (first[0], first[2]))
+            self.assertNotIn(ids[1], first)
+            self.assertEqual(set(memory.db.docstore._dict), set(ids))
+
+        self.run_async(run())
+
+    def test_failed_file_keeps_previous_chunks(self):
+        async def run():
+            memory = await self.get()
+            file_data = {}
+            await memory._reimport_file(file_data, self.batches(["chunk one"]))
+            before = dict(file_data)
+
+            with self.assertRaises(ValueError):
+                await memory._reimport_file(
+                    file_data,
+                    self.batches(["chunk one", "new chunk"], error=ValueError("parse")),
+                )
+            self.assertEqual(file_data, before)
+            self.assertEqual(set(memory.db.docstore._dict), set(before["ids"]))
+
+        self.run_async(run())
+
+
+@unittest.skipUnless(chromadb, "chromadb not installed")
+class TestLegacyChroma(MemoryTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(files, "get_base_dir", lambda: self.dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_store(self, *path: str):
+        # as the removed VectorDB left it, langchain's default collection
+        client = chromadb.PersistentClient(path=os.path.join(self.dir.name, *path))
+        collection = client.get_or_create_collection("langchain")
+        texts = ["remember the blue door", "the cat likes fish"]
+        collection.add(
+            ids=["a", "b"],
+            documents=texts,
+            embeddings=self.embeddings.embed_documents(texts),
+            metadatas=[{"id": "a"}, {"id": "b"}],
+        )
+
+    def test_default_subdir_store(self):
+        # memory_subdir "" in the config, the store is at memory/database
+        self.write_store("memory", "database")
+
+        async def run():
+            memory = await self.get("default")
+            docs = await memory.search_keyword("blue door", 5)
+            self.assertEqual([doc.metadata["id"] for doc in docs], ["a"])
+            self.assertEqual(docs[0].metadata["area"], Memory.Area.MAIN.value)
+            self.assertEqual(len(memory.db.docstore._dict), 2)
+
+        self.run_async(run())
+        self.assertFalse(os.path.exists(os.path.join(self.dir.name, "memory", "database")))
+        self.assertTrue(
+            os.path.isdir(os.path.join(self.dir.name, "memory", "database.imported"))
+        )
+
+    def test_named_subdir_store(self):
+        self.write_store("memory", "project", "database")
+
+        async def run():
+            memory = await self.get("project")
+            self.assertEqual(set(memory.db.docstore._dict), {"a", "b"})
+
+        self.run_async(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from langchain_core.documents import Document
+from python.helpers.memory import Memory, RetentionPolicy
+
+
+class FakeDb:
+    def __init__(self, docs: dict[str, Document]):
+        self.docstore = SimpleNamespace(_dict=docs)
+
+    def delete(self, ids):
+        for id in ids:
+            del self.docstore._dict[id]
+
+
+class FakeLexical:
+    def __init__(self):
+        self.removed: list[str] = []
+
+    def remove(self, ids):
+        self.removed += ids
+
+
+def days_ago(days: float) -> str:
+    return Memory.get_timestamp(datetime.now() - timedelta(days=days))
+
+
+class TestCompaction(unittest.TestCase):
+    def setUp(self):
+        retention = Memory.retention
+        Memory.retention = {"fragments": RetentionPolicy(max_count=2, max_age_days=30)}
+        self.addCleanup(setattr, Memory, "retention", retention)
+
+    def memory(self, docs: dict[str, tuple[str, str]], recalls: dict[str, str]):
+        # docs: id -> (area, created)
+        memory = object.__new__(Memory)
+        memory.memory_subdir = "test"
+        memory._db = FakeDb(
+            {
+                id: Document(id, metadata={"id": id, "area": area, "timestamp": created})
+                for id, (area, created) in docs.items()
+            }
+        )
+        memory._lexical = FakeLexical()
+        memory._recalls = recalls
+        memory.saved = 0
+
+        def save():
+            memory.saved += 1
+
+        memory._save_db = save
+        return memory
+
+    def test_evicts_expired_and_least_recently_recalled(self):
+        memory = self.memory(
+            {
+                "expired": ("fragments", days_ago(40)),
+                "old_recalled": ("fragments", days_ago(20)),
+                "old": ("fragments", days_ago(10)),
+                "new": ("fragments", days_ago(1)),
+                "main": ("main", days_ago(400)),  # no policy, kept
+            },
+            recalls={"old_recalled": days_ago(0), "deleted": days_ago(0)},
+        )
+        evicted = memory.compact()
+
+        self.assertEqual({doc.metadata["id"] for doc in evicted}, {"expired", "old"})
+        self.assertEqual(
+            set(memory.db.docstore._dict), {"old_recalled", "new", "main"}
+        )
+        self.assertEqual(set(memory.lexical.removed), {"expired", "old"})
+        self.assertEqual(set(memory.recalls), {"old_recalled"})  # stale hits dropped
+        self.assertEqual(memory.saved, 1)
+
+    def test_nothing_to_evict(self):
+        memory = self.memory({"new": ("fragments", days_ago(1))}, recalls={})
+        self.assertEqual(memory.compact(), [])
+        self.assertEqual(memory.saved, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
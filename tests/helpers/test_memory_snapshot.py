@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from python.helpers import memory_snapshot
+
+
+class TestMemorySnapshot(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "memory.snapshot")
+        self.vectors = np.random.rand(3, 8).astype(np.float32)
+        self.docs = [
+            {"id": f"id-{i}", "page_content": f"text {i}", "metadata": {"area": "main"}}
+            for i in range(3)
+        ]
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_round_trip(self):
+        memory_snapshot.write(self.path, self.vectors, self.docs, extra={"model": "m"})
+        snapshot = memory_snapshot.read(self.path)
+        np.testing.assert_array_equal(snapshot.vectors, self.vectors)
+        self.assertEqual(list(snapshot.iter_documents()), self.docs)
+        self.assertEqual(snapshot.extra, {"model": "m"})
+
+    def test_empty(self):
+        memory_snapshot.write(self.path, np.zeros((0, 8), dtype=np.float32), [])
+        snapshot = memory_snapshot.read(self.path)
+        self.assertEqual(snapshot.vectors.shape, (0, 8))
+        self.assertEqual(list(snapshot.iter_documents()), [])
+
+    def test_checksum_mismatch(self):
+        memory_snapshot.write(self.path, self.vectors, self.docs)
+        with open(self.path, "r+b") as f:
+            f.seek(memory_snapshot.ALIGN)
+            f.write(b"\xff\xff\xff\xff")
+        with self.assertRaises(ValueError):
+            memory_snapshot.read(self.path)
+
+    def test_count_mismatch(self):
+        with self.assertRaises(ValueError):
+            memory_snapshot.write(self.path, self.vectors, self.docs[:2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+from unittest import mock
+from agent import Agent
+from langchain_core.messages import HumanMessage
+
+
+def make_agent(number: int = 0, superior: Agent | None = None) -> Agent:
+    # the loop state only, __init__ reads the prompts and changes directory
+    agent = Agent.__new__(Agent)
+    agent.number = number
+    agent.history = []
+    agent.last_message = ""
+    agent.intervention_message = ""
+    agent.intervention_status = False
+    agent.data = {}
+    agent.listeners = []
+    if superior:
+        agent.set_data("superior", superior)
+        superior.set_data("subordinate", agent)
+    return agent
+
+
+class TestReset(unittest.TestCase):
+    def test_fresh_conversation(self):
+        agent = make_agent()
+        agent.history.append(HumanMessage(content="hello"))
+        agent.last_message = "hi"
+        agent.intervention_message = "stop"
+        agent.intervention_status = True
+        agent.set_data("plan", ["search"])
+        agent.listeners.append(print)
+
+        agent.reset()
+        self.assertEqual(agent.history, [])
+        self.assertEqual((agent.last_message, agent.intervention_message), ("", ""))
+        self.assertFalse(agent.intervention_status)
+        self.assertEqual(agent.data, {})
+        self.assertEqual(agent.listeners, [])
+
+    def test_shells_closed_down_the_chain(self):
+        agent0 = make_agent()
+        agent1 = make_agent(1, agent0)
+        shells = [mock.Mock(), mock.Mock()]
+        agent0.set_data("code_exec", mock.Mock(shell=shells[0]))
+        agent1.set_data("code_exec", mock.Mock(shell=shells[1]))
+        shells[0].close.side_effect = OSError("gone")  # the others still close
+
+        agent0.reset()
+        for shell in shells:
+            shell.close.assert_called_once()
+        self.assertEqual(agent1.data, {})
+        self.assertIsNone(agent0.get_data("subordinate"))
+
+
+class TestEmit(unittest.TestCase):
+    def test_events_reach_superiors(self):
+        # a listener on the top agent sees what subordinates do
+        agent0 = make_agent()
+        agent1 = make_agent(1, agent0)
+        top, sub = [], []
+        agent0.listeners.append(top.append)
+        agent1.listeners.append(sub.append)
+
+        agent1.emit("token", content="hi")
+        agent0.emit("response", content="done")
+        self.assertEqual(sub, [{"type": "token", "agent": 1, "content": "hi"}])
+        self.assertEqual(
+            top,
+            [
+                {"type": "token", "agent": 1, "content": "hi"},
+                {"type": "response", "agent": 0, "content": "done"},
+            ],
+        )
+
+    def test_failing_listener(self):
+        agent = make_agent()
+        events = []
+        agent.listeners += [mock.Mock(side_effect=RuntimeError("closed")), events.append]
+        with mock.patch("agent.PrintStyle"):
+            agent.emit("response_start")
+        self.assertEqual(events, [{"type": "response_start", "agent": 0}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -177,52 +177,117 @@ function generateGUID() {
 
 let lastLogVersion = 0;
 let lastLogGuid = ""
+let logItems = {} // full text of received log items, deltas are merged into it
+let lastContextsVersion = null
+let logFirst = 0 // items below are not sent by /poll, loaded on scroll up
+let loadingHistory = false
 
 async function poll() {
-    let updated = false
     try {
-        const response = await sendJsonData("/poll", { log_from: lastLogVersion, context });
+        const response = await sendJsonData("/poll", { log_from: lastLogVersion, context, deltas: true, contexts_version: lastContextsVersion });
         //console.log(response)
+        return applyState(response)
+
+    } catch (error) {
+        console.error('Error:', error);
+        const statusAD = Alpine.$data(statusSection);
+        statusAD.connected = false;
+    }
 
-        if (response.ok) {
+    return false
+}
 
-            setContext(response.context)
+// state from /poll or an /events message
+function applyState(response) {
+    let updated = false
+    if (response.ok) {
 
-            if (lastLogGuid != response.log_guid) {
-                chatHistory.innerHTML = ""
-                lastLogVersion = 0
-            }
+        setContext(response.context)
 
-            if (lastLogVersion != response.log_version) {
-                updated = true
-                for (const log of response.logs) {
-                    setMessage(log.no, log.type, log.heading, log.content, log.temp, log.kvps);
-                }
+        if (lastLogGuid != response.log_guid) {
+            chatHistory.innerHTML = ""
+            lastLogVersion = 0
+            logItems = {}
+        }
+
+        logFirst = response.log_first || 0
+
+        if (lastLogVersion != response.log_version) {
+            updated = true
+            for (const delta of response.logs) {
+                const log = mergeLog(delta)
+                if (!log) return resync()
+                setMessage(log.no, log.type, log.heading, log.content, log.temp, log.kvps);
             }
+        }
 
-            updateProgress(response.log_progress)
+        updateProgress(response.log_progress || knowledgeProgress(response.knowledge))
 
-            //set ui model vars from backend
-            const inputAD = Alpine.$data(inputSection);
-            inputAD.paused = response.paused;
-            const statusAD = Alpine.$data(statusSection);
-            statusAD.connected = response.ok;
+        //set ui model vars from backend
+        const inputAD = Alpine.$data(inputSection);
+        inputAD.paused = response.paused;
+        const statusAD = Alpine.$data(statusSection);
+        statusAD.connected = response.ok;
+        if (response.contexts) {  // sent only when the list changed
             const chatsAD = Alpine.$data(chatsSection);
             chatsAD.contexts = response.contexts;
+        }
+        lastContextsVersion = response.contexts_version;
 
-            lastLogVersion = response.log_version;
-            lastLogGuid = response.log_guid;
+        lastLogVersion = response.log_version;
+        lastLogGuid = response.log_guid;
 
 
+    }
+
+    return updated
+}
+
+// "deltas" holds the offset appended text continues at, per text field, in utf-16
+// code units like string length
+function mergeLog(log) {
+    const deltas = log.deltas
+    if (deltas) {
+        const prev = logItems[log.no]
+        if (!prev) return null
+        const merge = (base, text, offset) => {
+            if (base.length != offset) throw new Error("log delta out of sync")
+            return base + text
+        }
+        try {
+            for (const name of ["heading", "content"]) {
+                if (name in deltas) log[name] = merge(prev[name], log[name], deltas[name])
+            }
+            for (const [key, offset] of Object.entries(deltas.kvps || {})) {
+                log.kvps[key] = merge(String(prev.kvps?.[key] ?? ""), log.kvps[key], offset)
+            }
+        } catch (e) {
+            return null
         }
+        delete log.deltas
+    }
+    logItems[log.no] = log
+    return log
+}
 
-    } catch (error) {
-        console.error('Error:', error);
-        const statusAD = Alpine.$data(statusSection);
-        statusAD.connected = false;
+// start over with full log items after a delta could not be applied
+function resync() {
+    lastLogVersion = 0
+    logItems = {}
+    if (eventSource) {
+        lastLogGuid = ""
+        openEvents()
     }
+    return true
+}
 
-    return updated
+function knowledgeProgress(knowledge) {
+    for (const [subdir, status] of Object.entries(knowledge || {})) {
+        if (status.state == "pending" || status.state == "running") {
+            return `Importing knowledge in '/${subdir}': ${status.processed}/${status.files} files`
+        }
+    }
+    return ""
 }
 
 function updateProgress(progress) {
@@ -295,6 +360,8 @@ const setContext = function (id) {
     context = id
     lastLogGuid = ""
     lastLogVersion = 0
+    logItems = {}
+    if (eventSource) openEvents()
     const chatsAD = Alpine.$data(chatsSection);
     chatsAD.selected = id
 }
@@ -422,6 +489,37 @@ function updateAfterScroll() {
 }
 
 chatHistory.addEventListener('scroll', updateAfterScroll);
+chatHistory.addEventListener('scroll', () => {
+    if (chatHistory.scrollTop < 50) loadHistory()
+});
+
+// prepend a page of older log items, keeps the visible messages in place
+async function loadHistory() {
+    const oldest = chatHistory.querySelector('.message-container')
+    const before = oldest ? parseInt(oldest.id.replace('message-', '')) : logFirst
+    if (loadingHistory || before <= 0 || logFirst <= 0) return
+    loadingHistory = true
+    try {
+        const response = await sendJsonData("/log_history", { context, before, limit: 50 });
+        if (!response.ok || response.log_guid != lastLogGuid) return
+        const height = chatHistory.scrollHeight
+        const scroll = autoScroll
+        autoScroll = false
+        for (const log of response.logs.reverse()) {
+            if (document.getElementById(`message-${log.no}`)) continue
+            logItems[log.no] = log
+            setMessage(log.no, log.type, log.heading, log.content, log.temp, log.kvps);
+            const element = document.getElementById(`message-${log.no}`)
+            chatHistory.insertBefore(element, chatHistory.firstChild)
+        }
+        autoScroll = scroll
+        chatHistory.scrollTop += chatHistory.scrollHeight - height
+    } catch (e) {
+        console.error('Error:', e);
+    } finally {
+        loadingHistory = false
+    }
+}
 
 chatInput.addEventListener('input', adjustTextareaHeight);
 
@@ -452,4 +550,35 @@ async function startPolling() {
     _doPoll();
 }
 
-document.addEventListener("DOMContentLoaded", startPolling);
+// push channel, polling is the fallback when EventSource fails repeatedly
+let eventSource = null
+let eventFailures = 0
+const maxEventFailures = 3
+
+function openEvents() {
+    if (eventSource) eventSource.close()
+    const resume = lastLogGuid ? `${lastLogGuid}:${lastLogVersion}` : ""
+    const params = new URLSearchParams({ context, resume, deltas: 1 })
+    eventSource = new EventSource(`/events?${params}`)
+    eventSource.onopen = () => { eventFailures = 0 }
+    eventSource.onmessage = (event) => {
+        eventFailures = 0
+        applyState(JSON.parse(event.data))
+    }
+    eventSource.onerror = () => {
+        const statusAD = Alpine.$data(statusSection);
+        statusAD.connected = false;
+        if (++eventFailures >= maxEventFailures) {
+            eventSource.close()
+            eventSource = null
+            startPolling()
+        }
+    }
+}
+
+function startUpdates() {
+    if (window.EventSource) openEvents()
+    else startPolling()
+}
+
+document.addEventListener("DOMContentLoaded", startUpdates);